@@ -0,0 +1,150 @@
+import heapq
+import math
+import threading
+from collections import Counter
+from typing import Iterable, Optional
+
+
+# group_by name (the same as GET /stats takes) -> record field
+GROUP_FIELDS = {'city': 'city', 'gender': 'gender', 'verdict': 'bmi_verdict'}
+METRICS = ('bmi', 'age', 'weight_kg')
+
+
+# count / sum / sum of squares / min / max of one metric, kept up to date as
+# values come and go. Min and max come from two heaps with lazy deletion:
+# a removed value stays in the heaps until it reaches the top, the Counter
+# of live values tells whether a top entry is stale.
+class RunningStats:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self._live: Counter = Counter()
+        self._min_heap: list[float] = []
+        self._max_heap: list[float] = []  # negated values
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+        self._live[value] += 1
+        if self._live[value] == 1:
+            heapq.heappush(self._min_heap, value)
+            heapq.heappush(self._max_heap, -value)
+
+    def remove(self, value: float):
+        self.count -= 1
+        self.total -= value
+        self.total_squares -= value * value
+        self._live[value] -= 1
+        if not self._live[value]:
+            del self._live[value]
+            # stale entries are only dropped lazily, rebuild once they dominate
+            if len(self._min_heap) > 2 * len(self._live) + 32:
+                self._min_heap = list(self._live)
+                heapq.heapify(self._min_heap)
+                self._max_heap = [-live for live in self._live]
+                heapq.heapify(self._max_heap)
+        if not self.count:
+            # start from exact zeros again instead of accumulated rounding error
+            self.total = self.total_squares = 0.0
+
+    def _top(self, heap: list[float], sign: int) -> Optional[float]:
+        while heap and (sign * heap[0]) not in self._live:
+            heapq.heappop(heap)
+        return sign * heap[0] if heap else None
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {'mean': None, 'stddev': None, 'min': None, 'max': None}
+        mean = self.total / self.count
+        variance = max(self.total_squares / self.count - mean * mean, 0.0)
+        return {
+            'mean': round(mean, 2),
+            'stddev': round(math.sqrt(variance), 2),
+            'min': self._top(self._min_heap, 1),
+            'max': self._top(self._max_heap, -1),
+        }
+
+
+# count and RunningStats per metric for one group of patients
+class GroupStats:
+
+    def __init__(self):
+        self.count = 0
+        self.metrics = {name: RunningStats() for name in METRICS}
+
+    def add(self, record: dict):
+        self.count += 1
+        for name, running in self.metrics.items():
+            if record.get(name) is not None:
+                running.add(record[name])
+
+    def remove(self, record: dict):
+        self.count -= 1
+        for name, running in self.metrics.items():
+            if record.get(name) is not None:
+                running.remove(record[name])
+
+    def summary(self) -> dict:
+        return {'count': self.count, **{name: running.summary() for name, running in self.metrics.items()}}
+
+
+# Aggregates of every patient and per city, gender and bmi verdict.
+# Registered as a repository listener: a change subtracts the old record from
+# its groups and adds the new one, so GET /stats/summary never scans patients.
+class PatientAggregates:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = GroupStats()
+        self.groups: dict[str, dict[str, GroupStats]] = {group_by: {} for group_by in GROUP_FIELDS}
+
+    @staticmethod
+    def _label(group_by: str, record: dict) -> str:
+        value = record.get(GROUP_FIELDS[group_by])
+        return 'unknown' if value is None else str(value)
+
+    def _group(self, group_by: str, record: dict) -> GroupStats:
+        label = self._label(group_by, record)
+        groups = self.groups[group_by]
+        if label not in groups:
+            groups[label] = GroupStats()
+        return groups[label]
+
+    def _add(self, record: dict):
+        self.total.add(record)
+        for group_by in GROUP_FIELDS:
+            self._group(group_by, record).add(record)
+
+    def _remove(self, record: dict):
+        self.total.remove(record)
+        for group_by in GROUP_FIELDS:
+            group = self._group(group_by, record)
+            group.remove(record)
+            if not group.count:
+                del self.groups[group_by][self._label(group_by, record)]
+
+
+    def build(self, records: Iterable[dict]) -> 'PatientAggregates':
+        with self._lock:
+            for record in records:
+                self._add(record)
+        return self
+
+
+    # repository listener
+    def apply(self, old: Optional[dict], new: Optional[dict]):
+        with self._lock:
+            if old is not None:
+                self._remove(old)
+            if new is not None:
+                self._add(new)
+
+
+    def summary(self, group_by: Optional[str] = None) -> dict:
+        with self._lock:
+            if group_by is None:
+                return {'all': self.total.summary()}
+            return {label: group.summary() for label, group in sorted(self.groups[group_by].items())}
@@ -0,0 +1,24 @@
+import os
+from repository import PatientRepository
+from sqlite_store import SqliteStore
+from store import JournaledStore, JsonFileStore, PatientStore
+
+
+# Storage backends selectable per deployment (PATIENT_BACKEND):
+#   json   - whole JSON file rewritten on every write (the original behaviour)
+#   jsonl  - in-memory store + append-only log folded into the JSON file
+#   sqlite - SQLite database next to the JSON file (filled from it on first start)
+#   memory - in-memory store seeded from the JSON file, never written back
+BACKENDS = ('json', 'jsonl', 'sqlite', 'memory')
+
+
+def create_repository(backend: str, path: str = 'database.json', **options) -> PatientRepository:
+    if backend == 'json':
+        return JsonFileStore(path)
+    if backend == 'jsonl':
+        return JournaledStore(path, **options)
+    if backend == 'sqlite':
+        return SqliteStore(os.path.splitext(path)[0] + '.sqlite3', json_path=path, **options)
+    if backend == 'memory':
+        return PatientStore(path)
+    raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
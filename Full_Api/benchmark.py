@@ -0,0 +1,257 @@
+"""
+CRUD benchmark for the patient storage backends.
+
+Runs the same workload against every backend in a scratch directory:
+
+    python benchmark.py --patients 2000 --backends json jsonl sqlite memory
+
+With --stress, it instead hammers every backend from many threads at once
+(concurrent creates, page reads and read-modify-write updates of a shared
+patient) and checks that no write got lost:
+
+    python benchmark.py --stress --patients 5000 --threads 32
+
+With --check, it runs the same behaviour checks against every backend
+(create, duplicates, view, update, filters, paging, streaming, delete and
+reopening) and lists what differs from the expected results:
+
+    python benchmark.py --check --backends jsonl sqlite
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backends import BACKENDS, create_repository
+
+
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio', 'Dallas']
+DISEASES = ['Hypertension', 'Diabetes', 'Asthma', 'Arthritis', 'Migraine', 'Obesity', 'Allergies', 'Thyroid Disorder']
+
+
+def make_patient(patient_id: int) -> dict:
+    height_cm = random.randint(150, 200)
+    weight_kg = random.randint(45, 120)
+    bmi = round(weight_kg / (height_cm / 100) ** 2, 2)
+    return {
+        'id': patient_id,
+        'name': f'Patient {patient_id}',
+        'age': random.randint(0, 120),
+        'gender': random.choice(['Male', 'Female']),
+        'height_cm': float(height_cm),
+        'weight_kg': float(weight_kg),
+        'diseases': random.sample(DISEASES, random.randint(0, 3)),
+        'city': random.choice(CITIES),
+        'admitted_date': '2024-01-01',
+        'bmi': bmi,
+        'bmi_verdict': 'Normal weight',
+    }
+
+
+# run `fn` for every item, returns operations per second
+def timed(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - start
+    return len(items) / elapsed if elapsed else float('inf')
+
+
+def read_all(repository):
+    after = None
+    while True:
+        _, after = repository.page(after, 100)
+        if after is None:
+            return
+
+
+def run(backend: str, patients: list[dict], **options) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        repository = create_repository(backend, os.path.join(directory, 'database.json'), **options)
+        repository.load()
+        try:
+            results = {
+                'create': timed(repository.add, patients),
+                'get': timed(repository.get, [p['id'] for p in patients]),
+                'page': timed(lambda _: read_all(repository), range(5)) * len(patients),
+                'query': timed(lambda city: repository.query(city=city, diseases=['Asthma']), CITIES * 10),
+                'update': timed(repository.update, [{**p, 'age': (p['age'] + 1) % 120} for p in patients]),
+                'delete': timed(repository.delete, [p['id'] for p in patients]),
+            }
+        finally:
+            repository.close()
+    return results
+
+
+# Concurrent creates, reads and increments of one counter patient; returns
+# what got lost (an empty list if nothing did) and the time it took
+def stress(backend: str, patients: list[dict], threads: int, **options) -> tuple[list[str], float]:
+    with tempfile.TemporaryDirectory() as directory:
+        repository = create_repository(backend, os.path.join(directory, 'database.json'), **options)
+        repository.load()
+        try:
+            counter = make_patient(0)
+            counter['age'] = 0
+            repository.add(counter)
+            increment = lambda record: {**record, 'age': record['age'] + 1}
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                jobs = [pool.submit(repository.add, patient) for patient in patients]
+                jobs += [pool.submit(repository.modify, 0, increment) for _ in patients]
+                jobs += [pool.submit(read_all, repository) for _ in range(threads)]
+                for job in jobs:
+                    job.result()
+            elapsed = time.perf_counter() - start
+
+            problems = []
+            missing = [p['id'] for p in patients if repository.get(p['id']) != p]
+            if missing:
+                problems.append(f'{len(missing)} of {len(patients)} creates lost')
+            if len(repository) != len(patients) + 1:
+                problems.append(f'{len(repository)} patients stored, expected {len(patients) + 1}')
+            if repository.get(0)['age'] != len(patients):
+                problems.append(f"{len(patients) - repository.get(0)['age']} of {len(patients)} increments lost")
+        finally:
+            repository.close()
+        if backend == 'memory':  # never written back
+            return problems, elapsed
+        # and everything made it to disk
+        repository = create_repository(backend, os.path.join(directory, 'database.json'), **options)
+        repository.load()
+        try:
+            if len(repository) != len(patients) + 1 or repository.get(0)['age'] != len(patients):
+                problems.append('writes lost after reopening')
+        finally:
+            repository.close()
+    return problems, elapsed
+
+
+# Walks every page of a listing (`fetch(after)` returns one), returns the ids
+def paged_ids(fetch) -> list[int]:
+    ids, after = [], None
+    while True:
+        records, after = fetch(after)
+        ids += [record['id'] for record in records]
+        if after is None:
+            return ids
+
+
+# What every backend must do, as seen by the API; returns what it did not do
+# (an empty list if everything did)
+def check(backend: str, patients: list[dict], **options) -> list[str]:
+    problems = []
+
+    def expect(what: str, got, wanted):
+        if got != wanted:
+            problems.append(f'{what}: got {got!r}, expected {wanted!r}')
+
+    def filtered(city=None, disease=None) -> list[int]:
+        return [p['id'] for p in patients if (city is None or p['city'] == city)
+                and (disease is None or disease in p['diseases'])]
+
+    with tempfile.TemporaryDirectory() as directory:
+        repository = create_repository(backend, os.path.join(directory, 'database.json'), **options)
+        repository.load()
+        try:
+            # create / duplicate
+            expect('create', [repository.add(p) for p in patients[:2]], [True, True])
+            expect('duplicate create', repository.add({**patients[0], 'name': 'Other'}), False)
+            expect('bulk create with a duplicate', repository.add_many(patients[2:5] + [patients[1]]), [3])
+            expect('nothing of a failed bulk create added', repository.exists(patients[2]['id']), False)
+            expect('bulk create', repository.add_many(patients[2:]), [])
+            expect('count', len(repository), len(patients))
+
+            # view
+            expect('view', repository.get(patients[0]['id']), patients[0])
+            expect('view of a missing patient', repository.get(-1), None)
+
+            # update
+            changed = {**patients[0], 'city': CITIES[0], 'diseases': ['Asthma']}
+            expect('update returns the old record', repository.update(changed), patients[0])
+            expect('view after update', repository.get(changed['id']), changed)
+            expect('update of a missing patient', repository.update({**changed, 'id': -1}), None)
+            patients[0] = changed
+            old, new = repository.modify(changed['id'], lambda record: {**record, 'age': 7})
+            expect('read-modify-write', (old, new, repository.get(changed['id'])), (changed, {**changed, 'age': 7}, new))
+            patients[0] = new
+
+            # filter (case-insensitive) and paging
+            expect('page', paged_ids(lambda after: repository.page(after, 7)), [p['id'] for p in patients])
+            expect('filter by city', paged_ids(lambda after: repository.query(city=CITIES[0].upper(), after=after, limit=7)),
+                   filtered(city=CITIES[0]))
+            expect('filter by disease', paged_ids(lambda after: repository.query(diseases=['asthma'], after=after, limit=7)),
+                   filtered(disease='Asthma'))
+            expect('filter by city and disease',
+                   paged_ids(lambda after: repository.query(city=CITIES[0], diseases=['Asthma'], after=after, limit=7)),
+                   filtered(CITIES[0], 'Asthma'))
+            expect('filter by an unknown city', repository.query(city='Nowhere'), ([], None))
+
+            # stream
+            expect('stream', sorted(record['id'] for record in repository.iter_records()), [p['id'] for p in patients])
+
+            # delete
+            removed = patients.pop()
+            expect('delete returns the record', repository.delete(removed['id']), removed)
+            expect('delete of a missing patient', repository.delete(removed['id']), None)
+            expect('view after delete', repository.get(removed['id']), None)
+        finally:
+            repository.close()
+        if backend == 'memory':  # never written back
+            return problems
+        repository = create_repository(backend, os.path.join(directory, 'database.json'), **options)
+        repository.load()
+        try:
+            expect('after reopening', [repository.get(p['id']) for p in patients], patients)
+            expect('count after reopening', len(repository), len(patients))
+        finally:
+            repository.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=2000, help='number of patients to create')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--durability', default='always', help='durability mode of the jsonl backend')
+    parser.add_argument('--stress', action='store_true', help='check for lost writes under concurrency instead')
+    parser.add_argument('--threads', type=int, default=32, help='worker threads of the stress run')
+    parser.add_argument('--check', action='store_true', help='check the behaviour of every backend instead')
+    args = parser.parse_args()
+    if args.check and args.patients < 6:
+        parser.error('--check needs at least 6 patients')
+
+    random.seed(0)
+    patients = [make_patient(patient_id) for patient_id in range(1, args.patients + 1)]
+
+    if args.check:
+        failed = False
+        for backend in args.backends:
+            options = {'durability': args.durability} if backend == 'jsonl' else {}
+            problems = check(backend, [dict(patient) for patient in patients], **options)
+            print(f"{backend:<10}{'ok' if not problems else ''}")
+            for problem in problems:
+                print(f'    {problem}')
+            failed = failed or bool(problems)
+        raise SystemExit(1 if failed else 0)
+
+    if args.stress:
+        print(f"{args.patients} concurrent creates and increments, {args.threads} threads")
+        failed = False
+        for backend in args.backends:
+            options = {'durability': args.durability} if backend == 'jsonl' else {}
+            problems, elapsed = stress(backend, patients, args.threads, **options)
+            print(f"{backend:<10}{elapsed:>8.2f}s  {'; '.join(problems) or 'ok'}")
+            failed = failed or bool(problems)
+        raise SystemExit(1 if failed else 0)
+
+    print(f"{args.patients} patients, operations per second (page = records read per second)")
+    print(f"{'backend':<10}" + ''.join(f'{op:>12}' for op in ('create', 'get', 'page', 'query', 'update', 'delete')))
+    for backend in args.backends:
+        options = {'durability': args.durability} if backend == 'jsonl' else {}
+        results = run(backend, patients, **options)
+        print(f'{backend:<10}' + ''.join(f'{value:>12,.0f}' for value in results.values()))
+
+
+if __name__ == '__main__':
+    main()
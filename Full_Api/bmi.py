@@ -0,0 +1,36 @@
+from typing import Optional
+
+
+# BMI of a patient, rounded to 2 decimals
+def calculate_bmi(height_cm: Optional[float], weight_kg: Optional[float]) -> Optional[float]:
+    if weight_kg is None or height_cm is None:
+        return None
+    height_m = height_cm / 100
+    return round(weight_kg / (height_m ** 2), 2)
+
+
+VERDICTS = ("Underweight", "Normal weight", "Overweight", "Obesity")
+
+
+# verdict for a BMI value (stats.py has a vectorized copy of these thresholds)
+def classify_bmi(bmi: Optional[float]) -> str:
+    if bmi is None:
+        return "BMI not available"
+    if bmi < 18.5:
+        return "Underweight"
+    elif 18.5 <= bmi < 24.9:
+        return "Normal weight"
+    elif 25 <= bmi < 29.9:
+        return "Overweight"
+    else:
+        return "Obesity"
+
+
+# fill in bmi / bmi_verdict of a stored record that was written without them
+# (e.g. older database.json entries), so reads never have to compute them
+def materialize_bmi(record: dict) -> dict:
+    if record.get('bmi') is None:
+        record['bmi'] = calculate_bmi(record.get('height_cm'), record.get('weight_kg'))
+    if 'bmi_verdict' not in record:
+        record['bmi_verdict'] = classify_bmi(record['bmi'])
+    return record
@@ -0,0 +1,42 @@
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+
+# Conditional GET: validators are computed from repository versions (see
+# repository.py) before anything is read or serialized, so a client that
+# already has the current body gets an empty 304 for the price of a dict lookup.
+
+def make_etag(epoch: str, version: int) -> str:
+    return f'"{epoch}-{version}"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def validator_headers(etag: str, modified_at: float) -> dict:
+    return {'ETag': etag, 'Last-Modified': http_date(modified_at)}
+
+
+# If-None-Match (weak comparison, so W/ tags from proxies still match) wins
+# over If-Modified-Since when both are sent (RFC 9110 13.1.2, 13.2.2)
+def is_not_modified(request: Request, etag: str, modified_at: float) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(modified_at) <= since
+    return False
+
+
+# empty 304 if the request's validators still match, else None
+def not_modified(request: Request, etag: str, modified_at: float) -> Optional[Response]:
+    if is_not_modified(request, etag, modified_at):
+        return Response(status_code=304, headers=validator_headers(etag, modified_at))
+    return None
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Callable, Optional
+
+
+# (mtime, size, inode) of a file: an edit in place changes the first two, a
+# replace by rename (how most editors and write_snapshot() save) the inode
+def _signature(stat: os.stat_result) -> tuple[int, int, int]:
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+# A JSON file that rarely changes, kept in memory parsed and turned by `build`
+# into whatever is derived from it (e.g. indexes). get() costs one os.stat():
+# the file is only read and built again when its signature changed, so an
+# outside edit shows up on the very next call. The built value is swapped in
+# whole, callers never see it half rebuilt; `on_reload` runs after every swap
+# (e.g. to drop responses rendered from the old content). Async code uses
+# get_async(), which leaves the event loop only when there is a reload to do.
+class CachedFile:
+
+    def __init__(self, path: str, build: Callable[[Any], Any] = lambda data: data,
+                 on_reload: Optional[Callable[[Any], None]] = None):
+        self.path = path
+        self._build = build
+        self._on_reload = on_reload
+        self._lock = threading.Lock()
+        self._cached: Optional[tuple[tuple, Any]] = None  # (signature, value)
+        self.reloads = 0
+
+    def get(self) -> Any:
+        signature = _signature(os.stat(self.path))
+        cached = self._cached
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with self._lock:
+            cached = self._cached
+            if cached is None or cached[0] != signature:
+                with open(self.path, 'r') as f:
+                    # the signature of what is actually read, which may be
+                    # newer than the one stat() saw
+                    signature = _signature(os.fstat(f.fileno()))
+                    value = self._build(json.load(f))
+                cached = self._cached = (signature, value)
+                self.reloads += 1
+                if self._on_reload is not None:
+                    self._on_reload(value)
+        return cached[1]
+
+    async def get_async(self) -> Any:
+        cached = self._cached
+        if cached is not None and cached[0] == _signature(os.stat(self.path)):
+            return cached[1]
+        return await asyncio.to_thread(self.get)
@@ -0,0 +1,92 @@
+import time
+from typing import AsyncIterator, Callable
+from pydantic import ValidationError
+from repository import PatientRepository
+
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+MAX_LINE_BYTES = 1024 * 1024  # longer lines are rejected without being buffered
+MAX_REPORTED_ERRORS = 100  # errors listed in the progress report, the rest are only counted
+
+
+def new_progress(batch_size: int) -> dict:
+    return {
+        'lines': 0, 'imported': 0, 'failed': 0, 'batches': 0, 'batch_size': batch_size,
+        'started_at': time.time(), 'finished_at': None, 'errors': [],
+    }
+
+
+def _fail(progress: dict, line: int, patient_id, errors: list):
+    progress['failed'] += 1
+    if len(progress['errors']) < MAX_REPORTED_ERRORS:
+        progress['errors'].append({'line': line, 'id': patient_id, 'errors': errors})
+
+
+# the lines of a byte stream, without holding more than one line (at most
+# MAX_LINE_BYTES) plus one chunk in memory; too long lines come out as None
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes | None]:
+    buffer = b''
+    skipping = False
+    async for chunk in chunks:
+        *lines, rest = (buffer + chunk).split(b'\n')
+        for line in lines:
+            yield None if skipping or len(line) > MAX_LINE_BYTES else line
+            skipping = False
+        if len(rest) > MAX_LINE_BYTES:
+            skipping = True
+            rest = b''
+        buffer = rest
+    if skipping or len(buffer) > MAX_LINE_BYTES:
+        yield None
+    elif buffer:
+        yield buffer
+
+
+# validate and add one batch of (line number, line); invalid lines and
+# patients whose id is taken are reported, the rest added in one commit
+def _import_batch(store: PatientRepository, validate: Callable[[bytes], dict],
+                  lines: list[tuple[int, bytes]], progress: dict):
+    batch: list[tuple[int, dict]] = []
+    for number, line in lines:
+        try:
+            batch.append((number, validate(line)))
+        except ValidationError as error:
+            _fail(progress, number, None, error.errors(include_url=False, include_input=False))
+    while batch:
+        duplicates = set(store.add_many([record for _, record in batch]))
+        if not duplicates:
+            break
+        for position in sorted(duplicates):
+            line, record = batch[position]
+            _fail(progress, line, record['id'], [{'msg': "Patient ID already exists"}])
+        batch = [item for position, item in enumerate(batch) if position not in duplicates]
+    progress['imported'] += len(batch)
+    progress['batches'] += 1
+
+
+# Import an NDJSON stream of patients: every line is validated on its own
+# (`validate` turns it into a stored record or raises ValidationError) and
+# the valid patients of every `batch_size` lines are committed together.
+# Lines are only split off on the event loop; a batch is validated and
+# committed by one store.call(), off the loop. The next chunk is only read
+# once the previous batch is committed, so memory stays bounded however long
+# the stream is. `progress` is updated as the import goes.
+async def import_ndjson(chunks: AsyncIterator[bytes], validate: Callable[[bytes], dict],
+                        store: PatientRepository, batch_size: int, progress: dict) -> dict:
+    batch: list[tuple[int, bytes]] = []
+    async for line in _lines(chunks):
+        progress['lines'] += 1
+        number = progress['lines']
+        if line is None:
+            _fail(progress, number, None, [{'msg': f"Line is longer than {MAX_LINE_BYTES} bytes"}])
+            continue
+        if not line.strip():
+            continue
+        batch.append((number, line))
+        if len(batch) >= batch_size:
+            await store.call(_import_batch, store, validate, batch, progress)
+            batch = []
+    if batch:
+        await store.call(_import_batch, store, validate, batch, progress)
+    progress['finished_at'] = time.time()
+    return progress
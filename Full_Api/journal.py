@@ -0,0 +1,236 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Append-only write-ahead log of patient mutations.
+# Every create/update/delete is stored as one JSON line, e.g.
+#     {"op": "put", "patient": {...}}
+#     {"op": "delete", "id": 7}
+# so a write costs O(1) no matter how many patients exist. A snapshot folds the
+# log back into the JSON file and the log is started again from empty.
+class Journal:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = 0
+        self._file = None
+
+
+    def open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    # read back every complete entry; a torn last line (crash mid-write) is
+    # cut off so that new entries are appended after the last good one
+    def replay(self):
+        self.entries = 0
+        valid_size = 0
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # JSONDecodeError, or bytes that are not UTF-8
+                    break
+                valid_size += len(line)
+                self.entries += 1
+                yield entry
+        if os.path.getsize(self.path) != valid_size:
+            os.truncate(self.path, valid_size)
+
+
+    def append(self, entry: dict):
+        self.append_many([entry])
+
+
+    # one write + flush for a whole batch of entries
+    def append_many(self, entries: list[dict]):
+        self._file.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+        self._file.flush()
+        self.entries += len(entries)
+
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+
+
+    # start a new empty log (called right after a snapshot was written)
+    def reset(self):
+        self._file.truncate(0)
+        self._file.seek(0)
+        self.entries = 0
+
+
+# write the full list of patients atomically: tmp file + fsync + rename
+def write_snapshot(path: str, records: list[dict]):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(records, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# apply one log entry to a {id: record} mapping
+# both operations are idempotent, so replaying an entry twice is harmless
+def apply_entry(patients: dict, entry: dict):
+    if entry['op'] == 'put':
+        patient = entry['patient']
+        patients[patient['id']] = patient
+    elif entry['op'] == 'delete':
+        patients.pop(entry['id'], None)
+
+
+
+# durability modes of the GroupCommitWriter
+#   always  - fsync before every commit is acknowledged (one fsync per batch)
+#   batched - fsync at most every fsync_interval seconds, commits wait for it
+#   async   - acknowledge once the entry is handed to the OS (no fsync)
+DURABILITY_MODES = ('always', 'batched', 'async')
+
+_STOP = object()
+
+
+# Single writer thread that owns the journal.
+# Commits from all requests go through one queue; everything queued up while
+# the previous batch was being flushed (plus whatever arrives within
+# commit_window seconds, if set) is written with one write() and made durable
+# with one fsync(), so concurrent writers share the cost of a disk flush.
+class GroupCommitWriter:
+
+    def __init__(self, journal: Journal, durability: str = 'always',
+                 commit_window: float = 0.0, fsync_interval: float = 0.05):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}, got {durability!r}")
+        self.journal = journal
+        self.durability = durability
+        self.commit_window = commit_window
+        self.fsync_interval = fsync_interval
+        self._queue = queue.Queue()
+        self._thread = None
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='patient-journal-writer', daemon=True)
+        self._thread.start()
+
+
+    # wait for everything already submitted, then stop the writer thread
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+
+    # queue log entries; the future resolves once they meet the durability mode
+    def submit(self, entries: list[dict]) -> Future:
+        future = Future()
+        self._queue.put((entries, future))
+        return future
+
+
+    # queue a snapshot; it is ordered with the log entries, so it contains
+    # exactly the changes submitted before it and the log is reset right after
+    def checkpoint(self, path: str, records: list[dict]) -> Future:
+        future = Future()
+        self._queue.put((_Snapshot(path, records), future))
+        return future
+
+
+    def _run(self):
+        pending = []  # committed but not yet fsynced (batched mode)
+        last_sync = time.monotonic()
+        while True:
+            # wait for work, but wake up in time for a due batched fsync
+            timeout = None
+            if pending:
+                timeout = max(0.0, last_sync + self.fsync_interval - time.monotonic())
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                job = None
+
+            batch = []
+            stop = snapshot = None
+            if job is _STOP:
+                stop = job
+            elif job is not None:
+                batch.append(job)
+
+            # gather everything that arrives within the commit window
+            deadline = time.monotonic() + self.commit_window
+            while batch and not isinstance(batch[-1][0], _Snapshot):
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = job
+                    break
+                batch.append(job)
+            if batch and isinstance(batch[-1][0], _Snapshot):
+                snapshot = batch.pop()
+
+            futures = [future for _, future in batch]
+            try:
+                if batch:
+                    self.journal.append_many([entry for entries, _ in batch for entry in entries])
+                if self.durability == 'always' and futures:
+                    self.journal.sync()
+                    last_sync = time.monotonic()
+                elif self.durability == 'batched':
+                    pending.extend(futures)
+                    futures = []
+                    if pending and (stop or snapshot or time.monotonic() - last_sync >= self.fsync_interval):
+                        self.journal.sync()
+                        last_sync = time.monotonic()
+                        futures, pending = pending, []
+            except OSError as exc:
+                for future in futures + pending:
+                    future.set_exception(exc)
+                pending = []
+            else:
+                for future in futures:
+                    future.set_result(None)
+
+            if snapshot is not None:
+                self._write_snapshot(*snapshot)
+            if stop is not None:
+                if self.durability != 'always' and self.journal.entries:
+                    self.journal.sync()
+                return
+
+
+    def _write_snapshot(self, snapshot, future):
+        try:
+            write_snapshot(snapshot.path, snapshot.records)
+            self.journal.reset()
+        except OSError as exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(None)
+
+
+class _Snapshot:
+
+    def __init__(self, path: str, records: list[dict]):
+        self.path = path
+        self.records = records
@@ -1,10 +1,139 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, computed_field
-from typing import Optional, Annotated
-from fastapi.responses import JSONResponse
-import json 
-
-app = FastAPI()
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Body
+from pydantic import BaseModel, Field, computed_field, TypeAdapter, ValidationError
+from typing import Callable, Optional, Annotated, Literal
+from functools import cached_property
+from fastapi.responses import JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager, suppress
+from backends import create_repository
+from repository import PatientRepository, StorageFailed, get_repository
+from pagination import encode_cursor, decode_cursor
+from streaming import stream_records, stream_csv
+from bmi import calculate_bmi, classify_bmi
+import stats
+from aggregates import PatientAggregates
+from response_cache import ResponseCache, make_key, keyset_span
+from conditional import make_etag, not_modified, validator_headers
+from serialization import listing_body
+from ingest import NDJSON_TYPES, import_ndjson, new_progress
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import anyio.to_thread
+import asyncio
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = 'database.json'
+SNAPSHOT_INTERVAL = 60  # seconds between folding the write-ahead log into database.json
+COMPACT_THRESHOLD = 0.3  # compact the store once this share of its slots are tombstones
+
+EXPORT_PAGE_SIZE = 1000  # patients read from the store at a time by GET /patients/export
+
+# records read back from the store were validated when they were written and
+# are trusted; PATIENT_STRICT_VALIDATION=1 validates them again (at startup and
+# on every update), to track down records that got into the store some other way
+STRICT_VALIDATION = os.getenv('PATIENT_STRICT_VALIDATION', '0') == '1'
+
+# lines of POST /patients/import validated and committed per batch, unless the request asks otherwise
+IMPORT_BATCH_SIZE = int(os.getenv('PATIENT_IMPORT_BATCH_SIZE', '5000'))
+
+# storage backend: json, jsonl, sqlite or memory (see backends.py)
+BACKEND = os.getenv('PATIENT_BACKEND', 'jsonl')
+
+# durability of writes: always (fsync per commit), batched (fsync every N ms) or async (OS-buffered)
+DURABILITY = os.getenv('PATIENT_DURABILITY', 'always')
+COMMIT_WINDOW_MS = float(os.getenv('PATIENT_COMMIT_WINDOW_MS', '0'))
+FSYNC_INTERVAL_MS = float(os.getenv('PATIENT_FSYNC_INTERVAL_MS', '50'))
+
+# response cache of the read endpoints: size limit in bytes and time to live in seconds (0 = no expiry)
+CACHE_MAX_BYTES = int(os.getenv('PATIENT_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv('PATIENT_CACHE_TTL', '0'))
+
+# Routes that touch the store are async; the storage I/O they wait for runs on
+# an executor of PATIENT_IO_WORKERS threads (jsonl and memory only use it for
+# bulk writes, imports and snapshots). PATIENT_THREADPOOL_SIZE sizes AnyIO's
+# threadpool (40 by default), which still runs the sync routes and the
+# CPU-heavy parts of bulk requests, imports and streamed responses.
+IO_WORKERS = int(os.getenv('PATIENT_IO_WORKERS', '16'))
+THREADPOOL_SIZE = int(os.getenv('PATIENT_THREADPOOL_SIZE', '40'))
+
+
+def build_repository() -> PatientRepository:
+    if BACKEND == 'jsonl':
+        return create_repository(BACKEND, DATABASE_FILE, durability=DURABILITY,
+                                 commit_window=COMMIT_WINDOW_MS / 1000, fsync_interval=FSYNC_INTERVAL_MS / 1000)
+    if BACKEND == 'sqlite':
+        # store calls run on the I/O executor, streamed responses read from
+        # AnyIO's threadpool: one connection for each of their threads
+        return create_repository(BACKEND, DATABASE_FILE, pool_size=IO_WORKERS + THREADPOOL_SIZE)
+    return create_repository(BACKEND, DATABASE_FILE)
+
+
+# drop the cached responses a change of a patient affects
+def invalidate_cache(cache: ResponseCache, old: Optional[dict], new: Optional[dict]):
+    patient_id = (old or new)['id']
+    cache.invalidate_entry('id', ((False, patient_id), patient_id), removed=new is None)
+
+
+# periodically fold the write-ahead log back into database.json
+# and squeeze out deleted slots once there are too many of them; a failed
+# round (e.g. a full disk) is logged and the next one tries again
+async def maintenance_loop(repository: PatientRepository):
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await repository.call(repository.snapshot)
+            if repository.fragmentation() > COMPACT_THRESHOLD:
+                await repository.call(repository.compact)
+        except Exception:
+            logger.exception("Storage maintenance failed, retrying in %s seconds", SNAPSHOT_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    repository = build_repository()
+    repository.load()
+    repository.io_executor = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix='patient-io')
+    if STRICT_VALIDATION:
+        for record in repository.iter_records():
+            Patient(**record)
+    app.state.repository = repository
+    app.state.cache = ResponseCache(CACHE_MAX_BYTES, CACHE_TTL or None)
+    app.state.imports = deque(maxlen=20)  # progress of the running and latest imports
+    repository.subscribe(lambda old, new: invalidate_cache(app.state.cache, old, new))
+    # running totals for /stats/summary, kept up to date with every write
+    app.state.aggregates = PatientAggregates().build(repository.iter_records())
+    repository.subscribe(app.state.aggregates.apply)
+    # column arrays for /stats, kept up to date with every write
+    app.state.columns = None
+    if stats.np is not None:
+        app.state.columns = stats.PatientColumns().build(repository.iter_records())
+        repository.subscribe(app.state.columns.apply)
+    task = asyncio.create_task(maintenance_loop(repository))
+    try:
+        yield
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        try:
+            repository.close()
+        finally:
+            repository.io_executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# a backend whose commit failed takes no more writes until it is restarted
+@app.exception_handler(StorageFailed)
+async def storage_failed(request: Request, error: StorageFailed):
+    return JSONResponse(status_code=503, content={"detail": str(error)})
 
 #     "id": 7,
 #     "name": "Sarah Davis",
@@ -30,28 +159,19 @@ class Patient(BaseModel):
 
 
     # Computed fields for BMI and BMI verdict
+    # cached: computed once per patient, then stored with the record on create/update
     @computed_field
-    @property
+    @cached_property
     def bmi(self) -> float:
-        if self.weight_kg is None or self.height_cm is None:
-            return None # type: ignore
-        height_m = self.height_cm / 100
-        return round(self.weight_kg / (height_m ** 2), 2)
+        return calculate_bmi(self.height_cm, self.weight_kg) # type: ignore
     
     # Computed field for BMI verdict
     @computed_field
-    @property
+    @cached_property
     def bmi_verdict(self) -> str:
-        if self.bmi is None:
-            return "BMI not available"
-        if self.bmi < 18.5:
-            return "Underweight"
-        elif 18.5 <= self.bmi < 24.9:
-            return "Normal weight"
-        elif 25 <= self.bmi < 29.9:
-            return "Overweight"
-        else:
-            return "Obesity"
+        return classify_bmi(self.bmi)
+
+
 
 
 
@@ -59,6 +179,11 @@ class Patient(BaseModel):
 
 
 
+# columns of a CSV export, in stored record order
+EXPORT_FIELDS = tuple(Patient.model_fields) + tuple(Patient.model_computed_fields)
+
+# validates a whole JSON array of patients in one call (built once, reused)
+PatientList = TypeAdapter(list[Patient])
 
 
 # class for create new Patient
@@ -75,106 +200,385 @@ class Create_patient(BaseModel):
 
 
 
+# one item of a bulk update: the patient id plus the fields to change
+class Patch_patient(BaseModel):
+    id: Annotated[int, Field(..., ge=1, title="Patient ID", description="Unique identifier for the patient")]
+    name: Annotated[Optional[str], Field(default=None, max_length=100, title="Name of the Patient", description="Name of the patient")]
+    age: Annotated[Optional[int], Field(default=None, ge=0, le=120, title="Age of the Patient", description="Age of the patient")]
+    gender: Annotated[Optional[str], Field(default=None, max_length=10, title="Gender of the Patient" )]
+    height_cm: Annotated[Optional[float], Field(default=None, gt=0, title="Height in cm", description="Height of the patient in centimeters")]
+    weight_kg: Annotated[Optional[float], Field(default=None, gt=0, title="Weight in kg", description="Weight of the patient in kilograms")]
+    diseases: Annotated[Optional[list[str]], Field(default=None, title="List of Diseases", description="List of diseases the patient has")]
+    city: Annotated[Optional[str], Field(default=None, max_length=100, title="City of Residence", description="City where the patient resides")]
+    admitted_date: Annotated[Optional[str], Field(default=None, title="Date of Admission", description="Date when the patient was admitted to the hospital in YYYY-MM-DD format")]
 
+PatchAdapter = TypeAdapter(Patch_patient)
 
 
+# stored record with the given (non-None) fields changed. The changes come from
+# Create_patient / Patch_patient, which check the same constraints as Patient,
+# and the stored fields were validated when they were written, so the merge is
+# trusted: no Patient is built, only bmi / bmi_verdict are computed again.
+# With STRICT_VALIDATION the merged record goes through Patient as a whole.
+def merge_patient(existing_patient: dict, update_data: dict) -> dict:
+    current_patient = dict(existing_patient)
+    for key, value in update_data.items():
+        if value is not None:
+            current_patient[key] = value
+    if STRICT_VALIDATION:
+        return Patient(**current_patient).model_dump()
+    current_patient['bmi'] = calculate_bmi(current_patient.get('height_cm'), current_patient.get('weight_kg'))
+    current_patient['bmi_verdict'] = classify_bmi(current_patient['bmi'])
+    return current_patient
 
 
 
 
 
-# loading data from json file
-def load_data():
-    with open('database.json', 'r') as f:
-        data = json.load(f)
-    return data
 
 
-# saving data to json file
-def save_data(data):
-    with open('database.json', 'w') as f:
-        json.dump(data, f, indent=4)
 
 
 # Retrieve Data from Database
 @app.get("/show")
-def show_data():
-    data = load_data()
-    if not data:
+async def show_data(
+        request: Request,
+        limit: int = Query(100, ge=1, le=1000, title="Limit", description="Maximum number of patients to return"),
+        cursor: Optional[str] = Query(None, title="Cursor", description="next_cursor of the previous page"),
+        stream: Optional[Literal['json', 'ndjson']] = Query(None, title="Stream", description="Stream every patient as a JSON array or NDJSON instead of one page"),
+        store: PatientRepository = Depends(get_repository)
+    ):
+    # validators come from the collection version, taken before reading so
+    # a write racing with this request can only make the ETag older than the body
+    version, modified_at = store.version
+    etag = make_etag(store.epoch, version)
+    unchanged = not_modified(request, etag, modified_at)
+    if unchanged is not None:
+        return unchanged
+    headers = validator_headers(etag, modified_at)
+
+    # pages are cached until a write touches the id range they cover
+    cache = request.app.state.cache
+    key = make_key('show', limit=limit, cursor=cursor)
+    body = cache.get(key) if stream is None else None
+    if body is not None:
+        return Response(body, media_type='application/json', headers=headers)
+    generation = cache.generation
+
+    if not await store.call(len, store):
         raise HTTPException(status_code=404, detail="No data found")
-    return {"data": data}
+    if stream is not None:
+        response = stream_records(store.iter_records(), stream, encode=store.encoded)
+        response.headers.update(headers)
+        return response
+    after = decode_cursor('id', cursor)
+    data, last = await store.call(store.page, after, limit)
+    body = listing_body('data', store.encode_records(data), next_cursor=encode_cursor('id', last))
+    cache.put(key, body, span=keyset_span('id', after, last), generation=generation)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+# hit / miss counters of the response cache
+@app.get("/cache/stats")
+async def cache_stats(request: Request):
+    return request.app.state.cache.stats()
+
+
+# Search patients by city, gender and diseases (all filters must match)
+@app.get("/patients")
+async def search_patients(
+        city: Optional[str] = Query(None, title="City", description="Only patients living in this city", example="Chicago"),
+        gender: Optional[str] = Query(None, title="Gender", description="Only patients of this gender", example="Female"),
+        disease: Optional[list[str]] = Query(None, title="Disease", description="Only patients having this disease, can be repeated", example=["Asthma"]),
+        limit: int = Query(100, ge=1, le=1000, title="Limit", description="Maximum number of patients to return"),
+        cursor: Optional[str] = Query(None, title="Cursor", description="next_cursor of the previous page"),
+        store: PatientRepository = Depends(get_repository)
+    ):
+    data, last = await store.call(store.query, city, gender, disease, decode_cursor('id', cursor), limit)
+    body = listing_body('data', store.encode_records(data), next_cursor=encode_cursor('id', last))
+    return Response(body, media_type='application/json')
+
+
+# BMI, age and weight statistics, optionally grouped
+@app.get("/stats")
+def patient_stats(
+        request: Request,
+        group_by: Optional[Literal['city', 'gender', 'verdict']] = Query(None, title="Group By", description="Group the statistics by city, gender or BMI verdict"),
+        percentile: list[float] = Query([50, 90, 99], title="Percentiles", description="Percentiles to report (0-100), can be repeated")
+    ):
+    columns = request.app.state.columns
+    if columns is None:
+        raise HTTPException(status_code=501, detail="Statistics need numpy to be installed")
+    if any(not 0 <= p <= 100 for p in percentile):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    return {"group_by": group_by, "stats": stats.summarize(columns, group_by, tuple(percentile))}
+
+
+# Running count / mean / stddev / min / max, answered without scanning patients
+@app.get("/stats/summary")
+async def patient_stats_summary(
+        request: Request,
+        group_by: Optional[Literal['city', 'gender', 'verdict']] = Query(None, title="Group By", description="Group the summary by city, gender or BMI verdict")
+    ):
+    return {"group_by": group_by, "summary": request.app.state.aggregates.summary(group_by)}
+
+
+# Retrieve one patient by id
+@app.get("/view/{patient_id}")
+async def view_patient(patient_id: int, request: Request, store: PatientRepository = Depends(get_repository)):
+    version, modified_at = store.record_version(patient_id)
+    etag = make_etag(store.epoch, version)
+    unchanged = not_modified(request, etag, modified_at)
+    if unchanged is not None and await store.call(store.exists, patient_id):
+        return unchanged
+    patient = await store.call(store.get, patient_id)
+    if patient is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return JSONResponse({"patient": patient}, headers=validator_headers(etag, modified_at))
 
 
 # create ne patient
 @app.post("/create")
-def create_patient(patient: Patient):
+async def create_patient(patient: Patient, store: PatientRepository = Depends(get_repository)):
     """
     Create a new patient record.
     """
-    data = load_data()
-    
-    # Check if the patient ID already exists in the database
-    if any(p['id'] == patient.id for p in data):
+    # Append the new patient data and record it in the write-ahead log,
+    # unless the patient ID already exists in the database
+    if not await store.call(store.add, patient.dict()):
         raise HTTPException(status_code=400, detail="Patient ID already exists")
     
-    # Append the new patient data to the existing data
-    data.append(patient.dict())
-    
-    # Save the updated data back to the JSON file
-    save_data(data)
-    
     return {"message": "Patient created successfully", "patient": patient}
 
 
 
+# errors of a bulk request grouped per item: [{"index", "errors"}]
+def item_errors(error: ValidationError) -> list[dict]:
+    items: dict[int, list[dict]] = {}
+    for detail in error.errors(include_url=False, include_input=False):
+        index, *loc = detail['loc']
+        items.setdefault(index, []).append({'loc': loc, 'msg': detail['msg'], 'type': detail['type']})
+    return [{'index': index, 'errors': errors} for index, errors in sorted(items.items())]
+
+
+def validate_many(body: bytes) -> list[dict]:
+    try:
+        patients = PatientList.validate_json(body)
+    except ValidationError as error:
+        if any(not detail['loc'] for detail in error.errors()):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON array of patients")
+        raise HTTPException(status_code=422, detail=item_errors(error))
+    return [patient.model_dump() for patient in patients]
+
+
+# create many patients at once: the array is validated as a whole, and either
+# every patient is stored (in one commit) or none is
+@app.post("/patients/bulk")
+async def create_patients_bulk(request: Request, store: PatientRepository = Depends(get_repository)):
+    """
+    Create many patient records from a JSON array.
+    """
+    body = await request.body()
+    # validating is CPU work for the threadpool, storing is I/O for the store
+    records = await run_in_threadpool(validate_many, body)
+    duplicates = await store.call(store.add_many, records)
+    if duplicates:
+        raise HTTPException(status_code=409, detail=[
+            {'index': index, 'id': records[index]['id'], 'errors': [{'msg': "Patient ID already exists"}]}
+            for index in duplicates
+        ])
+    return {"message": "Patients created successfully", "created": len(records)}
+
+
+
+# stream an NDJSON body of patients into the store, committing in batches
+@app.post("/patients/import")
+async def import_patients(
+        request: Request,
+        batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=100_000, title="Batch Size", description="Lines validated and committed at a time"),
+        store: PatientRepository = Depends(get_repository)
+    ):
+    """
+    Import patients from an NDJSON request body, one patient per line.
+    """
+    content_type = request.headers.get('content-type', NDJSON_TYPES[0]).split(';')[0].strip()
+    if content_type not in NDJSON_TYPES:
+        raise HTTPException(status_code=415, detail="Send the patients as application/x-ndjson")
+    progress = new_progress(batch_size)
+    request.app.state.imports.append(progress)
+    await import_ndjson(request.stream(), lambda line: Patient.model_validate_json(line).model_dump(),
+                        store, batch_size, progress)
+    return {"message": "Import finished", **progress}
+
+
+# every patient with an id above `after`, in id order, read a page at a time
+def export_records(store: PatientRepository, after: Optional[int]):
+    entry = None if after is None else ((False, after), after)
+    while True:
+        records, entry = store.page(entry, EXPORT_PAGE_SIZE)
+        yield from records
+        if entry is None:
+            return
+
+
+# Stream every patient as NDJSON or CSV with constant memory. Rows come in id
+# order and start with the id, so an interrupted download can be resumed with
+# ?after=<id of the last complete row> instead of starting over
+@app.get("/patients/export")
+async def export_patients(
+        fmt: Literal['ndjson', 'csv'] = Query('ndjson', alias='format', title="Format", description="ndjson (one patient per line) or csv"),
+        after: Optional[int] = Query(None, ge=0, title="After", description="Resume token: id of the last patient already received"),
+        store: PatientRepository = Depends(get_repository)
+    ):
+    records = export_records(store, after)
+    if fmt == 'csv':
+        # no header row when resuming, the rows get appended to a partial file
+        response = stream_csv(records, EXPORT_FIELDS, header=after is None)
+    else:
+        response = stream_records(records, 'ndjson', encode=store.encoded)
+    response.headers['Content-Disposition'] = f'attachment; filename="patients.{fmt}"'
+    return response
+
+
+# progress of the running and latest imports
+@app.get("/patients/imports")
+async def list_imports(request: Request):
+    return {"imports": list(request.app.state.imports)}
+
+
+
 # update existing patient
 @app.put("/update/{patient_id}")
-def update_patient(patient_id: int, patient: Create_patient):
+async def update_patient(patient_id: int, patient: Create_patient, store: PatientRepository = Depends(get_repository)):
     """
     Update an existing patient record.
     """
-    data = load_data()
-    
-    # Check if the patient ID exists in the database
-    if patient_id < 1 or patient_id > len(data):
-        raise HTTPException(status_code=404, detail="Patient not found")
-    
-    current_patient = data[patient_id]
     update_data = patient.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        if value is not None:
-            current_patient[key] = value
-    current_patient['id'] = patient_id
-
-
-    patient_pydandic_obj = Patient(**existing_patient_info)
-    existing_patient_info = patient_pydandic_obj.model_dump()
-    data[patient_id] = existing_patient_info
-
-
-
-    # Save the updated data back to the JSON file
-    save_data(data)
-    return {"message": "Patient updated successfully", "updated_patient": current_patient}
+    update_data['id'] = patient_id
+
+    # Merge and save in one step, so a concurrent update of the same patient
+    # can't be lost in between, and record it in the write-ahead log; a merge
+    # failing strict validation raises before anything is written
+    try:
+        changed = await store.call(store.modify, patient_id, lambda existing_patient: merge_patient(existing_patient, update_data))
+    except ValidationError as error:
+        raise HTTPException(status_code=422, detail=error.errors(include_url=False, include_input=False))
+    if changed is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return {"message": "Patient updated successfully", "updated_patient": changed[1]}
+
+
+
+# results of a bulk update / delete: every item ends up "invalid", "not_found"
+# or done; with atomic, a single failed item fails the request (reporting the
+# failed items) and changes nothing
+def bulk_outcome(results: list[dict], atomic: bool) -> list[dict]:
+    failed = [result for result in results if result.get('status') in ('invalid', 'not_found')]
+    if atomic and failed:
+        status_code = 404 if all(result['status'] == 'not_found' for result in failed) else 422
+        raise HTTPException(status_code=status_code, detail=failed)
+    return results
+
+
+# the result per item and the valid changes: (result, id, fields to set)
+def validate_changes(body: bytes) -> tuple[list[dict], list[tuple[dict, int, dict]]]:
+    try:
+        items = json.loads(body)
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array of patient changes")
+
+    results, changes = [], []
+    for index, item in enumerate(items):
+        result = {'index': index, 'id': item.get('id') if isinstance(item, dict) else None}
+        results.append(result)
+        try:
+            patch = PatchAdapter.validate_python(item)
+            changes.append((result, patch.id, patch.model_dump(exclude_unset=True)))
+        except ValidationError as error:
+            result['status'] = 'invalid'
+            result['errors'] = error.errors(include_url=False, include_input=False)
+    return results, changes
+
+
+def update_many(results: list[dict], changes: list[tuple[dict, int, dict]],
+                store: PatientRepository, atomic: bool) -> list[dict]:
+    if atomic and len(changes) < len(results):
+        return bulk_outcome(results, atomic)
+
+    # merged inside the store's write lock, so a concurrent change to the same
+    # patient is never lost; a merge failing strict validation leaves nothing
+    # written, so its item is reported and the others are tried again
+    def merging(result: dict, update_data: dict) -> Callable[[dict], dict]:
+        def change(existing_patient: dict) -> dict:
+            try:
+                return merge_patient(existing_patient, update_data)
+            except ValidationError as error:
+                result['status'] = 'invalid'
+                result['errors'] = error.errors(include_url=False, include_input=False)
+                raise
+        return change
+
+    while True:
+        try:
+            outcomes = store.modify_many([(patient_id, merging(result, update_data))
+                                          for result, patient_id, update_data in changes], atomic)
+            break
+        except ValidationError:
+            remaining = [item for item in changes if 'status' not in item[0]]
+            if len(remaining) == len(changes):
+                raise
+            if atomic:
+                return bulk_outcome(results, atomic)
+            changes = remaining
+    for (result, _, _), outcome in zip(changes, outcomes):
+        result['status'] = 'not_found' if outcome is None else 'updated'
+    return bulk_outcome(results, atomic)
+
+
+# change many patients at once, all in one commit
+@app.patch("/patients/bulk")
+async def update_patients_bulk(
+        request: Request,
+        atomic: bool = Query(True, title="Atomic", description="Apply every change or none of them; otherwise apply the valid ones"),
+        store: PatientRepository = Depends(get_repository)
+    ):
+    """
+    Update many patient records from a JSON array of {id, fields to change}.
+    """
+    body = await request.body()
+    results, changes = await run_in_threadpool(validate_changes, body)
+    results = await store.call(update_many, results, changes, store, atomic)
+    return {"message": "Patients updated", "updated": sum(r['status'] == 'updated' for r in results), "results": results}
+
+
+# delete many patients at once, all in one commit
+@app.delete("/patients/bulk")
+async def delete_patients_bulk(
+        patient_ids: list[int] = Body(..., title="Patient IDs", description="Ids of the patients to delete"),
+        atomic: bool = Query(True, title="Atomic", description="Delete every patient or none of them; otherwise delete the ones that exist"),
+        store: PatientRepository = Depends(get_repository)
+    ):
+    """
+    Delete many patient records by id.
+    """
+    removed = await store.call(store.delete_many, patient_ids, atomic)
+    results = [{'index': index, 'id': patient_id, 'status': 'not_found' if record is None else 'deleted'}
+               for index, (patient_id, record) in enumerate(zip(patient_ids, removed))]
+    results = bulk_outcome(results, atomic)
+    return {"message": "Patients deleted", "deleted": sum(r['status'] == 'deleted' for r in results), "results": results}
 
 
 
 # delete existing patient
 @app.delete("/delete/{patient_id}")
-def delete_patient(patient_id: int):
+async def delete_patient(patient_id: int, store: PatientRepository = Depends(get_repository)):
     """
     Delete an existing patient record.
     """
-    data = load_data()
-    
-    # Check if the patient ID exists in the database
-    if patient_id < 1 or patient_id > len(data):
+    # Remove the patient and record the delete in the write-ahead log
+    if await store.call(store.delete, patient_id) is None:
         raise HTTPException(status_code=404, detail="Patient not found")
     
-    # Remove the patient from the data
-    del data[patient_id]
-    
-    # Save the updated data back to the JSON file
-    save_data(data)
-    
     return {"message": "Patient deleted successfully"}
\ No newline at end of file
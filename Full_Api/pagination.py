@@ -0,0 +1,38 @@
+import base64
+import json
+from typing import Optional
+from fastapi import HTTPException
+
+
+# Opaque cursors for keyset pagination.
+# A cursor carries the name of the ordering it belongs to and the (sort key, id)
+# entry of the last item of a page, so the next page starts with a binary
+# search instead of skipping `offset` items.
+def encode_cursor(ordering: str, entry: Optional[tuple]) -> Optional[str]:
+    if entry is None:
+        return None
+    raw = json.dumps([ordering, entry], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# `key_type` is the type (or tuple of types) of the sort key of the ordering;
+# a cursor whose key could not have come from it would fail to compare with
+# the real keys in the index, so it is rejected here as well
+def decode_cursor(ordering: str, cursor: Optional[str], key_type=int) -> Optional[tuple]:
+    if cursor is None:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_ordering, ((is_none, key), patient_id) = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_ordering != ordering or not _is(patient_id, int):
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this listing")
+    if not isinstance(is_none, bool) or (key is None) != is_none or not (is_none or _is(key, key_type)):
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this listing")
+    return ((is_none, key), patient_id)
+
+
+# isinstance() that does not take JSON true/false for numbers
+def _is(value, types) -> bool:
+    return isinstance(value, types) and not isinstance(value, bool)
@@ -0,0 +1,174 @@
+import asyncio
+import math
+import secrets
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Iterator, Optional
+from fastapi import Request
+from serialization import encode_json
+
+
+# Storage interface the patient routes depend on.
+# Records are plain dicts shaped like Patient.model_dump(). Listings are
+# paged in id order: `after` / the returned entry are keyset cursor entries
+# of the form ((False, id), id), see pagination.py.
+#
+# Listeners registered with subscribe() are called as listener(old, new) for
+# every change (old is None for a create, new is None for a delete), in
+# commit order, so derived views (statistics, caches) can follow along.
+#
+# Every change also bumps the collection version and stamps the changed
+# record with it, for ETag / Last-Modified validators. Versions count from
+# 0 (unchanged since startup) and are scoped by `epoch`, which differs per
+# process, so validators from before a restart never match. Only the latest
+# RECORD_VERSIONS_KEPT stamps are kept; any other record reports the newest
+# stamp dropped so far, which is never older than its real one.
+# Modification times are whole seconds (the resolution of Last-Modified) and
+# every version gets a later one than the version before, so a change made
+# in the same second as an earlier response still moves Last-Modified on; a
+# burst of writes runs these stamps ahead of the clock until writes slow down.
+#
+# Async routes go through call(), which by default runs the blocking method
+# on `io_executor`: a pool of its own, so storage I/O neither waits for nor
+# holds the AnyIO worker threads that serve sync routes.
+class PatientRepository(ABC):
+
+    RECORD_VERSIONS_KEPT = 100_000
+
+    def __init__(self):
+        self._listeners: list[Callable[[Optional[dict], Optional[dict]], None]] = []
+        self.epoch = secrets.token_hex(4)
+        self.started_at = time.time()
+        self.version: tuple[int, float] = (0, math.ceil(self.started_at))  # (version, modified at)
+        self._record_versions: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self._dropped_version: tuple[int, float] = self.version
+        self.io_executor: Optional[Executor] = None  # None: the event loop's default executor
+
+    def subscribe(self, listener: Callable[[Optional[dict], Optional[dict]], None]):
+        self._listeners.append(listener)
+
+    # called by the backends for every change, one at a time in commit order
+    def _notify(self, old: Optional[dict], new: Optional[dict]):
+        self.version = (self.version[0] + 1, max(math.ceil(time.time()), self.version[1] + 1))
+        patient_id = (new or old)['id']
+        self._record_versions.pop(patient_id, None)
+        if new is not None:
+            self._record_versions[patient_id] = self.version
+            if len(self._record_versions) > self.RECORD_VERSIONS_KEPT:
+                self._dropped_version = max(self._dropped_version, self._record_versions.popitem(last=False)[1])
+        for listener in self._listeners:
+            listener(old, new)
+
+    # (version, modified at) of one patient, whether or not it exists
+    def record_version(self, patient_id: int) -> tuple[int, float]:
+        return self._record_versions.get(patient_id, self._dropped_version)
+
+
+    # await fn(*args), where fn reads or writes this repository
+    async def call(self, fn: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, fn, *args)
+
+
+    # called once at startup / shutdown
+    def load(self):
+        pass
+
+    def close(self):
+        pass
+
+    # periodic maintenance, only meaningful for some backends
+    def snapshot(self):
+        pass
+
+    def compact(self):
+        pass
+
+    def fragmentation(self) -> float:
+        return 0.0
+
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    @abstractmethod
+    def get(self, patient_id: int) -> Optional[dict]: ...
+
+    def exists(self, patient_id: int) -> bool:
+        return self.get(patient_id) is not None
+
+    # every patient, without building the full list in memory
+    @abstractmethod
+    def iter_records(self) -> Iterator[dict]: ...
+
+    # one page in id order plus the entry to continue after (None on the last page)
+    @abstractmethod
+    def page(self, after: Optional[tuple] = None, limit: int = 100) -> tuple[list[dict], Optional[tuple]]: ...
+
+    # like page(), restricted to patients matching every given filter (case-insensitive)
+    @abstractmethod
+    def query(self, city: Optional[str] = None, gender: Optional[str] = None,
+              diseases: Optional[list[str]] = None,
+              after: Optional[tuple] = None, limit: int = 100) -> tuple[list[dict], Optional[tuple]]: ...
+
+    # JSON bytes of one record / a JSON array of records as returned by the
+    # methods above; backends that hand out the same record objects every
+    # time can keep them encoded
+    def encoded(self, record: dict) -> bytes:
+        return encode_json(record)
+
+    def encode_records(self, records: list[dict]) -> bytes:
+        return encode_json(records)
+
+
+    # returns False if a patient with the same id already exists
+    @abstractmethod
+    def add(self, record: dict) -> bool: ...
+
+    # add several patients in one commit; if any id already exists or repeats
+    # within `records`, nothing is added and the positions of the offending
+    # records are returned
+    @abstractmethod
+    def add_many(self, records: list[dict]) -> list[int]: ...
+
+    # replace the patient with the same id, returns the old record (None if not found)
+    @abstractmethod
+    def update(self, record: dict) -> Optional[dict]: ...
+
+    # returns the removed record (None if not found)
+    @abstractmethod
+    def delete(self, patient_id: int) -> Optional[dict]: ...
+
+    # update() / delete() for many patients in one commit, returning the old
+    # record (None if not found) per item; with `atomic`, nothing is changed
+    # unless every patient was found
+    @abstractmethod
+    def update_many(self, records: list[dict], atomic: bool = True) -> list[Optional[dict]]: ...
+
+    @abstractmethod
+    def delete_many(self, patient_ids: list[int], atomic: bool = True) -> list[Optional[dict]]: ...
+
+    # Read-modify-write: `change` turns the stored record into the new one and
+    # runs with writes held off, so concurrent changes to the same patient all
+    # land instead of overwriting each other. A repeated id gets the record the
+    # earlier change made. Returns (old, new) per item, None if not found; with
+    # `atomic`, nothing is changed unless every patient was found.
+    @abstractmethod
+    def modify_many(self, changes: list[tuple[int, Callable[[dict], dict]]],
+                    atomic: bool = True) -> list[Optional[tuple[dict, dict]]]: ...
+
+    def modify(self, patient_id: int, change: Callable[[dict], dict]) -> Optional[tuple[dict, dict]]:
+        return self.modify_many([(patient_id, change)])[0]
+
+
+# Raised by writes once a backend can no longer make changes durable (e.g. its
+# log could not be written); it takes a restart to recover.
+class StorageFailed(RuntimeError):
+    pass
+
+
+# FastAPI dependency: the repository chosen at startup (async, so resolving
+# it does not take a trip through the threadpool)
+async def get_repository(request: Request) -> PatientRepository:
+    return request.app.state.repository
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+# one end of a span: None (unbounded) or (entry, inclusive)
+Bound = Optional[tuple[tuple, bool]]
+
+
+# cache key of a route call: the route name plus its query parameters, sorted
+# by name so the order they came in does not matter
+def make_key(route: str, **params) -> tuple:
+    return (route,) + tuple(sorted(
+        (name, tuple(value) if isinstance(value, list) else value) for name, value in params.items()
+    ))
+
+
+# Span of sorted entries ((sort key, id) pairs, see sorted_index.py) a keyset
+# page depends on: everything between the cursor it started after and the last
+# entry it returned (open ended on the final page). A change outside of it
+# leaves the page as it was, except for removals after the page: they can
+# leave nothing behind it, which takes away its next_cursor.
+def keyset_span(scope: str, cursor: Optional[tuple], last: Optional[tuple]) -> tuple:
+    start = None if cursor is None else (cursor, False)
+    stop = None if last is None else (last, True)
+    return (scope, start, stop)
+
+
+def _below(entry: tuple, lower: Bound) -> bool:
+    return lower is not None and (entry < lower[0] or (entry == lower[0] and not lower[1]))
+
+def _above(entry: tuple, upper: Bound) -> bool:
+    return upper is not None and (entry > upper[0] or (entry == upper[0] and not upper[1]))
+
+
+def _affects(entry: tuple, span: tuple, removed: bool) -> bool:
+    _, lower, upper = span
+    if removed:
+        return not _below(entry, lower)
+    return not _below(entry, lower) and not _above(entry, upper)
+
+
+class _Entry:
+    __slots__ = ('body', 'expires', 'span')
+
+    def __init__(self, body: bytes, expires: Optional[float], span: Optional[tuple]):
+        self.body = body
+        self.expires = expires
+        self.span = span
+
+
+# Rendered response bodies, bounded by their total size in bytes.
+# Least recently used entries are evicted first; with a ttl an entry also
+# expires that many seconds after it was stored. A page of a sorted listing
+# stored with a span is dropped when a changed entry of the same scope falls
+# inside it (see keyset_span); everything goes with clear().
+class ResponseCache:
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._spans: dict[str, set] = {}
+        self._bytes = 0
+        # bumped by every invalidation, see put()
+        self.generation = 0
+
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.body
+
+
+    # store a body; `generation` is the value read before the response was
+    # built: if anything was invalidated since, the body may be stale and is
+    # not stored
+    def put(self, key: Hashable, body: bytes, span: Optional[tuple] = None,
+            generation: Optional[int] = None):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self._entries[key] = _Entry(body, expires, span)
+            self._bytes += len(body)
+            if span is not None:
+                self._spans.setdefault(span[0], set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+        if entry.span is not None:
+            self._spans[entry.span[0]].discard(key)
+
+
+    # drop every page of `scope` that an added, changed or removed entry affects
+    def invalidate_entry(self, scope: str, entry: tuple, removed: bool = False):
+        with self._lock:
+            self.generation += 1
+            for key in list(self._spans.get(scope, ())):
+                if _affects(entry, self._entries[key].span, removed):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                self._drop(key)
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,55 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+# raised by read() / write(blocking=False) when they would have to wait
+class LockBusy(RuntimeError):
+    pass
+
+
+# Many readers or one writer at a time.
+# Writers are preferred: once a writer waits, new readers queue behind it, so
+# a steady stream of reads cannot starve the writes. Not reentrant.
+class ReadWriteLock:
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+
+    @contextmanager
+    def read(self, blocking: bool = True) -> Iterator[None]:
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                if not blocking:
+                    raise LockBusy()
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+
+    @contextmanager
+    def write(self, blocking: bool = True) -> Iterator[None]:
+        with self._condition:
+            if not blocking and (self._writing or self._readers):
+                raise LockBusy()
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
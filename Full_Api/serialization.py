@@ -0,0 +1,17 @@
+import json
+
+
+# JSON bytes encoded exactly like JSONResponse renders them, so bodies
+# assembled from encoded records are byte-for-byte what FastAPI would send
+def encode_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+# {"<key>":[<record>,...],"<field>":<value>,...} around an already encoded
+# array of records (see PatientRepository.encode_records)
+def listing_body(key: str, records: bytes, **fields) -> bytes:
+    parts = [b'{', encode_json(key), b':', records]
+    for name, value in fields.items():
+        parts += [b',', encode_json(name), b':', encode_json(value)]
+    parts.append(b'}')
+    return b''.join(parts)
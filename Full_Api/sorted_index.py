@@ -0,0 +1,197 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain, islice
+from typing import Callable, Iterator, Optional
+
+
+# Sorted list of comparable items, split into blocks of at most BLOCK_SIZE
+# items with the last item of every block kept in `_maxes`. Finding an item
+# is a bisect over the maxes and one inside its block, and an insert or remove
+# only shifts the items of that one block -- unlike a plain list, where they
+# shift everything behind them, which at 400k items costs ~200 us each.
+class SortedList:
+
+    BLOCK_SIZE = 1000
+
+    def __init__(self, items=()):
+        self._set(sorted(items))
+
+
+    # replace the contents with already sorted items
+    def _set(self, items: list):
+        half = self.BLOCK_SIZE // 2
+        self._blocks = [items[start:start + half] for start in range(0, len(items), half)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(items)
+
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        return chain.from_iterable(self._blocks)
+
+    def __contains__(self, item) -> bool:
+        block = bisect_left(self._maxes, item)
+        if block == len(self._maxes):
+            return False
+        items = self._blocks[block]
+        return items[bisect_left(items, item)] == item
+
+
+    def add(self, item):
+        if not self._blocks:
+            self._blocks.append([item])
+            self._maxes.append(item)
+        else:
+            block = min(bisect_left(self._maxes, item), len(self._maxes) - 1)
+            items = self._blocks[block]
+            insort(items, item)
+            self._maxes[block] = items[-1]
+            if len(items) > self.BLOCK_SIZE:
+                half = len(items) // 2
+                self._blocks[block:block + 1] = [items[:half], items[half:]]
+                self._maxes[block:block + 1] = [items[half - 1], items[-1]]
+        self._len += 1
+
+    # remove `item` if present
+    def discard(self, item):
+        block = bisect_left(self._maxes, item)
+        if block == len(self._maxes):
+            return
+        items = self._blocks[block]
+        position = bisect_left(items, item)
+        if items[position] != item:
+            return
+        del items[position]
+        self._len -= 1
+        if items:
+            self._maxes[block] = items[-1]
+        else:
+            del self._blocks[block]
+            del self._maxes[block]
+
+
+    # smallest item >= `item`, None if there is none
+    def ceiling(self, item):
+        block = bisect_left(self._maxes, item)
+        if block == len(self._maxes):
+            return None
+        items = self._blocks[block]
+        return items[bisect_left(items, item)]
+
+
+    # items after `item` (all of them when None), ascending
+    def iter_after(self, item=None) -> Iterator:
+        if item is None:
+            return iter(self)
+        block = bisect_right(self._maxes, item)
+        if block == len(self._blocks):
+            return iter(())
+        items = self._blocks[block]
+        return chain(items[bisect_right(items, item):], chain.from_iterable(self._blocks[block + 1:]))
+
+    # items before `item` (all of them when None), descending
+    def iter_before(self, item=None) -> Iterator:
+        if item is None:
+            return chain.from_iterable(reversed(items) for items in reversed(self._blocks))
+        block = bisect_left(self._maxes, item)
+        if block == len(self._blocks):
+            return self.iter_before()
+        items = self._blocks[block]
+        head = items[:bisect_left(items, item)]
+        return chain(reversed(head), chain.from_iterable(reversed(items) for items in reversed(self._blocks[:block])))
+
+    # items from position `start` on, ascending (or counted from the end and
+    # descending); whole blocks are skipped without touching their items
+    def iter_from(self, start: int, reverse: bool = False) -> Iterator:
+        blocks = reversed(self._blocks) if reverse else iter(self._blocks)
+        for items in blocks:
+            if start < len(items):
+                items = items[::-1] if reverse else items
+                return chain(items[start:], chain.from_iterable(
+                    reversed(rest) if reverse else rest for rest in blocks))
+            start -= len(items)
+        return iter(())
+
+
+# Patient ids kept sorted by one field.
+# Entries are (sort key, id) pairs in a SortedList: they are sorted once when
+# built and then kept sorted by inserts and removes that only touch one block,
+# so a sorted page is a bisect and a short walk instead of a sorted() call.
+class SortedIndex:
+
+    # batches of more than 1/BULK_RATIO of the index are merged in (or taken
+    # out) with one re-blocking pass over all entries; smaller ones go one
+    # entry at a time
+    BULK_RATIO = 8
+
+    def __init__(self, key: Callable[[dict], object]):
+        self.key = key
+        self._entries = SortedList()
+
+
+    # records with no value for the field sort after all the others
+    def entry(self, record: dict) -> tuple:
+        value = self.key(record)
+        return ((value is None, value), record['id'])
+
+
+    def build(self, records) -> 'SortedIndex':
+        self._entries = SortedList(self.entry(record) for record in records)
+        return self
+
+
+    def insert(self, record: dict):
+        self._entries.add(self.entry(record))
+
+
+    # many at once: a large batch is sorted and merged in one pass (Timsort
+    # finds the two sorted runs) instead of one insert each; a small one is
+    # inserted entry by entry, so it costs nothing like a pass over the index
+    def insert_many(self, records: list[dict]):
+        if len(records) * self.BULK_RATIO < len(self._entries):
+            for record in records:
+                self._entries.add(self.entry(record))
+            return
+        entries = list(self._entries)
+        entries.extend(self.entry(record) for record in records)
+        entries.sort()
+        self._entries._set(entries)
+
+
+    def remove(self, record: dict):
+        self._entries.discard(self.entry(record))
+
+
+    # many at once: a large batch in one pass over the entries instead of one
+    # removal each, a small one entry by entry (see insert_many())
+    def remove_many(self, records: list[dict]):
+        if len(records) * self.BULK_RATIO < len(self._entries):
+            for record in records:
+                self._entries.discard(self.entry(record))
+            return
+        removed = {self.entry(record) for record in records}
+        self._entries._set([entry for entry in self._entries if entry not in removed])
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    # offset page: the `limit` entries from position `offset` on in the given
+    # order; whole blocks before it are skipped, so only the page is walked
+    def at(self, offset: int, limit: Optional[int] = None, order: str = 'asc') -> list[tuple]:
+        return list(islice(self._entries.iter_from(offset, reverse=order == 'desc'), limit))
+
+    # ids of one page in ascending or descending order
+    def ids(self, order: str = 'asc', offset: int = 0, limit: Optional[int] = None) -> list[int]:
+        return [patient_id for _, patient_id in self.at(offset, limit, order)]
+
+
+    # keyset page: the `limit` entries that come right after `entry` (a
+    # (key, id) pair taken from a previous page) in the given order; costs
+    # the same for deep pages as for the first one
+    def after(self, entry: Optional[tuple], limit: int, order: str = 'asc') -> list[tuple]:
+        if order == 'desc':
+            return list(islice(self._entries.iter_before(entry), limit))
+        return list(islice(self._entries.iter_after(entry), limit))
@@ -0,0 +1,359 @@
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from bmi import materialize_bmi
+from repository import PatientRepository
+
+
+# fields of a stored patient (Patient.model_dump() order) and the columns of the patients table
+FIELDS = ('id', 'name', 'age', 'gender', 'height_cm', 'weight_kg', 'diseases', 'city', 'admitted_date', 'bmi', 'bmi_verdict')
+COLUMNS = tuple(field for field in FIELDS if field != 'diseases')
+
+# connections kept open: one per thread that may read or write at the same
+# time; main.py passes its I/O executor plus AnyIO threadpool size instead
+POOL_SIZE = 40
+# statements kept compiled per connection, keyed by their SQL text
+STATEMENT_CACHE_SIZE = 128
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    age INTEGER,
+    gender TEXT COLLATE NOCASE,
+    height_cm REAL,
+    weight_kg REAL,
+    city TEXT COLLATE NOCASE,
+    admitted_date TEXT,
+    bmi REAL,
+    bmi_verdict TEXT,
+    has_diseases INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS patient_diseases (
+    patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    disease TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (patient_id, position)
+);
+CREATE INDEX IF NOT EXISTS patients_city ON patients (city, id);
+CREATE INDEX IF NOT EXISTS patients_gender ON patients (gender, id);
+CREATE INDEX IF NOT EXISTS patients_bmi_verdict ON patients (bmi_verdict, id);
+CREATE INDEX IF NOT EXISTS patient_diseases_disease ON patient_diseases (disease, patient_id);
+'''
+
+# All SQL below is built once from constants, so every call reuses the same
+# text and hits the per-connection prepared statement cache.
+
+# the diseases of a patient come back as a JSON array from a correlated subquery
+SELECT = (
+    'SELECT ' + ', '.join(COLUMNS) + ', has_diseases, '
+    '(SELECT json_group_array(disease) FROM '
+    '(SELECT disease FROM patient_diseases WHERE patient_id = patients.id ORDER BY position)) '
+    'FROM patients'
+)
+SELECT_ONE = SELECT + ' WHERE id = ?'
+COUNT = 'SELECT COUNT(*) FROM patients'
+SELECT_IDS = 'SELECT id FROM patients WHERE id IN ({})'  # placeholders filled in per chunk size
+INSERT = 'INSERT INTO patients (' + ', '.join(COLUMNS) + ', has_diseases) VALUES (' + ', '.join('?' * (len(COLUMNS) + 1)) + ')'
+UPDATE = 'UPDATE patients SET ' + ', '.join(f'{column} = ?' for column in COLUMNS[1:]) + ', has_diseases = ? WHERE id = ?'
+DELETE = 'DELETE FROM patients WHERE id = ?'
+INSERT_DISEASE = 'INSERT INTO patient_diseases (patient_id, position, disease) VALUES (?, ?, ?)'
+DELETE_DISEASES = 'DELETE FROM patient_diseases WHERE patient_id = ?'
+
+FILTER_AFTER = 'id > ?'
+FILTER_CITY = 'city = ?'
+FILTER_GENDER = 'gender = ?'
+FILTER_DISEASE = 'id IN (SELECT patient_id FROM patient_diseases WHERE disease = ?)'
+
+
+# Patients stored in SQLite (the "sqlite" backend), stdlib sqlite3 only.
+# Filters and pages are answered by SQL over indexed columns; diseases live in
+# a child table. The database runs in WAL mode, so readers on the pooled
+# connections never block the writer (and vice versa). Writes of this process
+# go one at a time under a lock, and listeners are notified right after the
+# commit, so they see committed changes in commit order.
+class SqliteStore(PatientRepository):
+
+    def __init__(self, path: str = 'database.sqlite3', json_path: Optional[str] = None,
+                 pool_size: int = POOL_SIZE):
+        super().__init__()
+        self.path = path
+        self.json_path = json_path
+        self.pool_size = pool_size
+        self._pool: queue.Queue = queue.Queue()
+        self._write_lock = threading.RLock()  # reentrant for modify_many()
+
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode: transactions are started explicitly in _transaction()
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               cached_statements=STATEMENT_CACHE_SIZE, timeout=30)
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+
+    # open the pool; a new database is created and filled from the JSON file once
+    def load(self):
+        created = not os.path.exists(self.path)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript(SCHEMA)
+        self._pool.put(conn)
+        for _ in range(self.pool_size - 1):
+            self._pool.put(self._connect())
+        if created and self.json_path is not None and os.path.exists(self.json_path):
+            self.import_json(self.json_path)
+
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # write transaction; BEGIN IMMEDIATE takes the write lock up front so two
+    # writers never deadlock trying to upgrade a read lock
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+
+    @staticmethod
+    def _row_to_record(row) -> dict:
+        values = dict(zip(COLUMNS, row))
+        has_diseases, diseases = row[len(COLUMNS)], row[len(COLUMNS) + 1]
+        values['diseases'] = json.loads(diseases) if has_diseases else None
+        return {field: values[field] for field in FIELDS}
+
+    @staticmethod
+    def _record_to_row(record: dict) -> list:
+        return [record.get(column) for column in COLUMNS] + [int(record.get('diseases') is not None)]
+
+
+    def _fetch(self, sql: str, params=()) -> list[dict]:
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+
+    def __len__(self) -> int:
+        with self._connection() as conn:
+            return conn.execute(COUNT).fetchone()[0]
+
+    def get(self, patient_id: int) -> Optional[dict]:
+        records = self._fetch(SELECT_ONE, (patient_id,))
+        return records[0] if records else None
+
+    # walk the table in id order, one page at a time
+    def iter_records(self) -> Iterator[dict]:
+        after = None
+        while True:
+            records, after = self.page(after, 500)
+            yield from records
+            if after is None:
+                return
+
+
+    def page(self, after: Optional[tuple] = None, limit: int = 100) -> tuple[list[dict], Optional[tuple]]:
+        return self.query(after=after, limit=limit)
+
+    def query(self, city: Optional[str] = None, gender: Optional[str] = None,
+              diseases: Optional[list[str]] = None,
+              after: Optional[tuple] = None, limit: int = 100) -> tuple[list[dict], Optional[tuple]]:
+        where, params = [], []
+        if after is not None:
+            where.append(FILTER_AFTER)
+            params.append(after[1])
+        if city is not None:
+            where.append(FILTER_CITY)
+            params.append(city)
+        if gender is not None:
+            where.append(FILTER_GENDER)
+            params.append(gender)
+        for disease in diseases or []:
+            where.append(FILTER_DISEASE)
+            params.append(disease)
+        sql = SELECT + (' WHERE ' + ' AND '.join(where) if where else '') + ' ORDER BY id LIMIT ?'
+        records = self._fetch(sql, params + [limit + 1])
+        more = len(records) > limit
+        records = records[:limit]
+        last = records[-1]['id'] if more else None
+        return records, (None if last is None else ((False, last), last))
+
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, record: dict):
+        conn.execute(INSERT, SqliteStore._record_to_row(record))
+        SqliteStore._insert_diseases(conn, record)
+
+    @staticmethod
+    def _insert_diseases(conn: sqlite3.Connection, record: dict):
+        conn.executemany(INSERT_DISEASE, [(record['id'], position, disease)
+                                          for position, disease in enumerate(record.get('diseases') or [])])
+
+
+    def add(self, record: dict) -> bool:
+        with self._write_lock:
+            try:
+                with self._transaction() as conn:
+                    self._insert(conn, record)
+            except sqlite3.IntegrityError:
+                return False
+            self._notify(None, record)
+        return True
+
+    # one transaction for the whole batch; taken ids are looked up in chunks
+    # that stay below SQLite's limit of bound parameters
+    def add_many(self, records: list[dict]) -> list[int]:
+        with self._write_lock:
+            with self._transaction() as conn:
+                ids = [record['id'] for record in records]
+                taken = set()
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    taken.update(row[0] for row in conn.execute(
+                        SELECT_IDS.format(', '.join('?' * len(chunk))), chunk))
+                seen = set()
+                duplicates = []
+                for position, patient_id in enumerate(ids):
+                    if patient_id in taken or patient_id in seen:
+                        duplicates.append(position)
+                    seen.add(patient_id)
+                if duplicates:
+                    return duplicates
+                conn.executemany(INSERT, [self._record_to_row(record) for record in records])
+                conn.executemany(INSERT_DISEASE, [(record['id'], position, disease) for record in records
+                                                  for position, disease in enumerate(record.get('diseases') or [])])
+            for record in records:
+                self._notify(None, record)
+        return []
+
+    def update(self, record: dict) -> Optional[dict]:
+        with self._write_lock:
+            with self._transaction() as conn:
+                row = conn.execute(SELECT_ONE, (record['id'],)).fetchone()
+                if row is None:
+                    return None
+                conn.execute(UPDATE, self._record_to_row(record)[1:] + [record['id']])
+                conn.execute(DELETE_DISEASES, (record['id'],))
+                self._insert_diseases(conn, record)
+            old_record = self._row_to_record(row)
+            self._notify(old_record, record)
+        return old_record
+
+    def delete(self, patient_id: int) -> Optional[dict]:
+        with self._write_lock:
+            with self._transaction() as conn:
+                row = conn.execute(SELECT_ONE, (patient_id,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute(DELETE, (patient_id,))
+            old_record = self._row_to_record(row)
+            self._notify(old_record, None)
+        return old_record
+
+
+    def update_many(self, records: list[dict], atomic: bool = True) -> list[Optional[dict]]:
+        with self._write_lock:
+            with self._transaction() as conn:
+                # a repeated id replaces what the earlier item wrote
+                current: dict[int, dict] = {}
+                old_records = []
+                for record in records:
+                    if record['id'] not in current:
+                        row = conn.execute(SELECT_ONE, (record['id'],)).fetchone()
+                        current[record['id']] = None if row is None else self._row_to_record(row)
+                    old_records.append(current[record['id']])
+                    if current[record['id']] is not None:
+                        current[record['id']] = record
+                if atomic and None in old_records:
+                    return old_records
+                found = [record for record, old_record in zip(records, old_records) if old_record is not None]
+                conn.executemany(UPDATE, [self._record_to_row(record)[1:] + [record['id']] for record in found])
+                final = {record['id']: record for record in found}
+                conn.executemany(DELETE_DISEASES, [(patient_id,) for patient_id in final])
+                conn.executemany(INSERT_DISEASE, [(record['id'], position, disease) for record in final.values()
+                                                  for position, disease in enumerate(record.get('diseases') or [])])
+            for record, old_record in zip(records, old_records):
+                if old_record is not None:
+                    self._notify(old_record, record)
+        return old_records
+
+    def modify_many(self, changes: list[tuple[int, Callable[[dict], dict]]],
+                    atomic: bool = True) -> list[Optional[tuple[dict, dict]]]:
+        with self._write_lock:
+            # no other write can commit while the lock is held, so what get()
+            # reads stays current until update_many() writes the changes
+            current: dict[int, Optional[dict]] = {}
+            records = []
+            for patient_id, change in changes:
+                existing = current[patient_id] if patient_id in current else self.get(patient_id)
+                current[patient_id] = None if existing is None else change(existing)
+                records.append(current[patient_id])
+            found = [record for record in records if record is not None]
+            if atomic and len(found) < len(records):
+                return [None if record is None else (self.get(record['id']), record) for record in records]
+            old_records = iter(self.update_many(found, atomic))
+        return [None if record is None else (next(old_records), record) for record in records]
+
+    def delete_many(self, patient_ids: list[int], atomic: bool = True) -> list[Optional[dict]]:
+        with self._write_lock:
+            with self._transaction() as conn:
+                # a repeated id only counts as found the first time
+                seen = set()
+                records = []
+                for patient_id in patient_ids:
+                    row = conn.execute(SELECT_ONE, (patient_id,)).fetchone() if patient_id not in seen else None
+                    records.append(None if row is None else self._row_to_record(row))
+                    seen.add(patient_id)
+                if atomic and None in records:
+                    return records
+                conn.executemany(DELETE, [(record['id'],) for record in records if record is not None])
+            for record in records:
+                if record is not None:
+                    self._notify(record, None)
+        return records
+
+
+    # one-shot migration: copy every patient of a database.json file in one transaction
+    def import_json(self, json_path: str) -> int:
+        with open(json_path, 'r') as f:
+            data = json.load(f)
+        with self._transaction() as conn:
+            for record in data:
+                self._insert(conn, materialize_bmi(record))
+        return len(data)
+
+
+# python sqlite_store.py [database.json] [database.sqlite3]
+if __name__ == '__main__':
+    json_path = sys.argv[1] if len(sys.argv) > 1 else 'database.json'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_path)[0] + '.sqlite3'
+    if os.path.exists(db_path):
+        sys.exit(f"{db_path} already exists, nothing migrated")
+    store = SqliteStore(db_path, json_path=json_path, pool_size=1)
+    store.load()
+    try:
+        print(f"migrated {len(store)} patients from {json_path} to {db_path}")
+    finally:
+        store.close()
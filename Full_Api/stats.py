@@ -0,0 +1,177 @@
+import threading
+from typing import Iterable, Optional
+from bmi import VERDICTS
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only GET /stats needs it
+    np = None
+
+
+GROUP_FIELDS = ('city', 'gender')
+METRICS = ('bmi', 'age', 'weight_kg')
+
+
+# Patient data kept as NumPy columns for analytics.
+# One row per patient: numeric columns for age / height / weight, and the
+# categorical fields dictionary-encoded as integer codes. Deleted rows are
+# masked out and reused, like the slots of the patient store. The columns
+# follow the repository through its listener (apply).
+class PatientColumns:
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._rows: dict[int, int] = {}  # patient id -> row
+        self._free: list[int] = []
+        self._size = 0
+        self.labels: dict[str, list[str]] = {field: [] for field in GROUP_FIELDS}
+        self._codes: dict[str, dict[str, int]] = {field: {} for field in GROUP_FIELDS}
+        self._allocate(capacity)
+
+
+    def _allocate(self, capacity: int):
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.age = np.zeros(capacity, dtype=np.float64)
+        self.height_cm = np.zeros(capacity, dtype=np.float64)
+        self.weight_kg = np.zeros(capacity, dtype=np.float64)
+        self.group_codes = {field: np.zeros(capacity, dtype=np.int32) for field in GROUP_FIELDS}
+
+    def _grow(self):
+        old = (self.alive, self.age, self.height_cm, self.weight_kg, self.group_codes)
+        self._allocate(len(self.alive) * 2)
+        for new_column, old_column in zip((self.alive, self.age, self.height_cm, self.weight_kg), old[:4]):
+            new_column[:len(old_column)] = old_column
+        for field in GROUP_FIELDS:
+            self.group_codes[field][:len(old[4][field])] = old[4][field]
+
+
+    def _code(self, field: str, value) -> int:
+        label = 'unknown' if value is None else str(value)
+        codes = self._codes[field]
+        if label not in codes:
+            codes[label] = len(self.labels[field])
+            self.labels[field].append(label)
+        return codes[label]
+
+
+    def _put(self, record: dict):
+        row = self._rows.get(record['id'])
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self.alive):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            self._rows[record['id']] = row
+        self.alive[row] = True
+        self.age[row] = record.get('age') if record.get('age') is not None else np.nan
+        self.height_cm[row] = record.get('height_cm') or np.nan
+        self.weight_kg[row] = record.get('weight_kg') or np.nan
+        for field in GROUP_FIELDS:
+            self.group_codes[field][row] = self._code(field, record.get(field))
+
+    def _remove(self, patient_id: int):
+        row = self._rows.pop(patient_id, None)
+        if row is not None:
+            self.alive[row] = False
+            self._free.append(row)
+
+
+    def build(self, records: Iterable[dict]) -> 'PatientColumns':
+        with self._lock:
+            for record in records:
+                self._put(record)
+        return self
+
+
+    # repository listener
+    def apply(self, old: Optional[dict], new: Optional[dict]):
+        with self._lock:
+            if new is None:
+                self._remove(old['id'])
+            else:
+                self._put(new)
+
+
+    # copies of the live rows, taken under the lock
+    def snapshot(self) -> dict:
+        with self._lock:
+            mask = self.alive[:self._size]
+            columns = {
+                'age': self.age[:self._size][mask],
+                'height_cm': self.height_cm[:self._size][mask],
+                'weight_kg': self.weight_kg[:self._size][mask],
+            }
+            for field in GROUP_FIELDS:
+                columns[field] = self.group_codes[field][:self._size][mask]
+            labels = {field: list(self.labels[field]) for field in GROUP_FIELDS}
+        return {'columns': columns, 'labels': labels}
+
+
+# vectorized copy of bmi.calculate_bmi / bmi.classify_bmi
+def vectorized_bmi(height_cm, weight_kg):
+    return np.round(weight_kg / (height_cm / 100) ** 2, 2)
+
+def vectorized_verdicts(bmi):
+    conditions = [
+        bmi < 18.5,
+        (18.5 <= bmi) & (bmi < 24.9),
+        (25 <= bmi) & (bmi < 29.9),
+    ]
+    return np.select(conditions, [0, 1, 2], default=3)
+
+
+def _describe(values, percentiles: list[float]) -> dict:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'mean': None, 'min': None, 'max': None, 'percentiles': {}}
+    points = np.percentile(values, percentiles) if percentiles else []
+    return {
+        'mean': round(float(values.mean()), 2),
+        'min': round(float(values.min()), 2),
+        'max': round(float(values.max()), 2),
+        'percentiles': {f'p{p:g}': round(float(v), 2) for p, v in zip(percentiles, points)},
+    }
+
+
+# count, mean, min, max and percentiles of bmi, age and weight, for all
+# patients or grouped by city, gender or bmi verdict
+def summarize(columns: PatientColumns, group_by: Optional[str] = None,
+              percentiles: tuple[float, ...] = (50, 90, 99)) -> dict:
+    snapshot = columns.snapshot()
+    data, labels = snapshot['columns'], snapshot['labels']
+    metrics = {
+        'bmi': vectorized_bmi(data['height_cm'], data['weight_kg']),
+        'age': data['age'],
+        'weight_kg': data['weight_kg'],
+    }
+    percentiles = list(percentiles)
+
+    if group_by is None:
+        return {'all': _summary(metrics, slice(None), percentiles)}
+
+    if group_by == 'verdict':
+        codes, names = vectorized_verdicts(metrics['bmi']), list(VERDICTS)
+        # mirror classify_bmi for patients without a bmi
+        codes = np.where(np.isnan(metrics['bmi']), len(names), codes)
+        names.append("BMI not available")
+    else:
+        codes, names = data[group_by], labels[group_by]
+
+    # sort rows by group once, then every group is one contiguous slice
+    order = np.argsort(codes, kind='stable')
+    group_codes, starts, counts = np.unique(codes[order], return_index=True, return_counts=True)
+    sorted_metrics = {name: values[order] for name, values in metrics.items()}
+    return {
+        names[code]: _summary(sorted_metrics, slice(start, start + count), percentiles)
+        for code, start, count in zip(group_codes.tolist(), starts.tolist(), counts.tolist())
+    }
+
+
+def _summary(metrics: dict, rows: slice, percentiles: list[float]) -> dict:
+    summary = {'count': int(len(metrics['age'][rows]))}
+    for name in METRICS:
+        summary[name] = _describe(metrics[name][rows], percentiles)
+    return summary
@@ -0,0 +1,526 @@
+import os
+import json
+import asyncio
+from collections import defaultdict
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Any, Callable
+from bmi import materialize_bmi
+from journal import Journal, GroupCommitWriter, apply_entry, write_snapshot
+from repository import PatientRepository, StorageFailed
+from rwlock import LockBusy, ReadWriteLock
+from serialization import encode_json
+from sorted_index import SortedIndex, SortedList
+
+
+# commits of the running call() to await, instead of blocking on them; set
+# while call() runs a method right on the event loop
+_pending_commits: ContextVar[list[Future] | None] = ContextVar('pending_commits', default=None)
+
+
+# In-memory patient store (the "memory" backend).
+# The JSON file at `path` (if any) is parsed once at startup and every read is
+# served from memory; subclasses below add persistence by overriding _commit().
+#
+# Records live in fixed slots: a delete only leaves a tombstone (None) and puts
+# the slot on a free list for the next create, so no other record moves.
+# compact() squeezes the tombstones out when too many of them pile up.
+#
+# Secondary indexes map a field value to the sorted list of patient ids having
+# it (diseases is multi-valued, so it is an inverted index: disease -> ids).
+# Listings are paged in id order with keyset cursors over a sorted id index.
+#
+# Reads share a reader/writer lock and run in parallel, writes hold it alone,
+# so a read never sees a change half applied (e.g. during compact()).
+# call() runs single-record reads and writes (and one page) right on the
+# event loop, everything bigger on the I/O executor; on the loop the lock is
+# never waited for: if a thread holds it, the call moves to the executor.
+#
+# A write is applied in memory (and seen by readers and listeners) before its
+# commit has finished: readers see a change before it is durable, the writer
+# gets its answer only once it is. Should a commit fail, memory is ahead of
+# the disk and there is no undoing what listeners and readers have seen, so
+# the store fails: from then on writes raise StorageFailed and nothing more
+# is written (snapshots included), until a restart reloads what is durable.
+#
+# Records are never modified in place (an update stores a new dict), so the
+# JSON bytes of a record can be kept next to it and reused for every listing
+# until the record is replaced.
+class PatientStore(PatientRepository):
+
+    INDEXED_FIELDS = ('city', 'gender', 'diseases')
+
+    def __init__(self, path: str | None = None):
+        super().__init__()
+        self.path = path
+        self._slots: list[dict | None] = []  # None marks a deleted record (tombstone)
+        self._free: list[int] = []  # tombstoned slots, reused by add()
+        self._index: dict[int, int] = {}  # patient id -> slot
+        self._secondary: dict[str, defaultdict[str, SortedList]] = {field: defaultdict(SortedList) for field in self.INDEXED_FIELDS}
+        self._by_id = SortedIndex(lambda record: record['id'])
+        self._encoded: dict[int, tuple[dict, bytes]] = {}  # patient id -> (record, its JSON)
+        self._lock = ReadWriteLock()
+        self._failure: Exception | None = None  # the commit that failed, see above
+
+
+    def load(self):
+        patients = self._read()
+        with self._writing():
+            self._slots = list(patients.values())
+            self._free = []
+            self._index = {p['id']: slot for slot, p in enumerate(self._slots)}
+            self._secondary = self._build_secondary(self._slots)
+            self._by_id.build(self._slots)
+            self._encoded = {}
+
+
+    # {id: record} as stored in the JSON file
+    def _read(self) -> dict[int, dict]:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = []
+        return {p['id']: materialize_bmi(p) for p in data}
+
+
+    # persist log entries ({"op": "put"|"delete", ...}); called under the
+    # lock, the returned future resolves once the change is durable
+    def _commit(self, entries: list[dict]) -> Future:
+        done = Future()
+        done.set_result(None)
+        return done
+
+
+    # _commit() that puts the store into the failed state if the commit fails
+    def _submit(self, entries: list[dict]) -> Future:
+        try:
+            done = self._commit(entries)
+        except OSError as error:
+            done = Future()
+            done.set_exception(error)
+        done.add_done_callback(self._committed)
+        return done
+
+    def _committed(self, done: Future):
+        if done.exception() is not None and self._failure is None:
+            self._failure = done.exception()
+
+    def _check_writable(self):
+        if self._failure is not None:
+            raise StorageFailed(f"Storage failed, a commit could not be written: {self._failure}") from self._failure
+
+    # block until a commit is durable, or hand it to the running call()
+    def _wait(self, done: Future | None):
+        if done is None:
+            return
+        pending = _pending_commits.get()
+        if pending is None:
+            done.result()
+        else:
+            pending.append(done)
+
+    # Small calls are work in memory under a briefly held lock, so they run
+    # right on the event loop; only the commit (the journal's fsync) is
+    # awaited, without holding any thread while it is. Bulk writes, snapshots
+    # and whatever else calls in (e.g. an import batch) take the executor, as
+    # does a small call that finds the lock held by a thread.
+    INLINE_CALLS = frozenset({'get', 'exists', 'page', 'query', 'add', 'update', 'delete', 'modify', '__len__'})
+
+    async def call(self, fn: Callable[..., Any], *args) -> Any:
+        inline = fn is len or (getattr(fn, '__self__', None) is self and fn.__name__ in self.INLINE_CALLS)
+        if not inline:
+            return await super().call(fn, *args)
+        pending: list[Future] | None = []
+        token = _pending_commits.set(pending)
+        try:
+            result = fn(*args)
+        except LockBusy:  # raised before anything changed, so it can run again
+            pending = None
+        finally:
+            _pending_commits.reset(token)
+        if pending is None:
+            return await super().call(fn, *args)
+        for done in pending:
+            await asyncio.wrap_future(done)
+        return result
+
+    # the lock, but not waiting for it when call() runs on the event loop
+    def _reading(self):
+        return self._lock.read(blocking=_pending_commits.get() is None)
+
+    def _writing(self):
+        return self._lock.write(blocking=_pending_commits.get() is None)
+
+
+    # share of slots that are tombstones
+    def fragmentation(self) -> float:
+        return len(self._free) / len(self._slots) if self._slots else 0.0
+
+
+    # drop the tombstones and renumber the slots
+    def compact(self):
+        with self._writing():
+            self._slots = self.all()
+            self._free = []
+            self._index = {p['id']: slot for slot, p in enumerate(self._slots)}
+
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def all(self) -> list[dict]:
+        return [p for p in self._slots if p is not None]
+
+    # lazily walk all patients (for streaming); never copies the store
+    def iter_records(self):
+        for record in self._slots:
+            if record is not None:
+                yield record
+
+    def exists(self, patient_id: int) -> bool:
+        return patient_id in self._index
+
+    def get(self, patient_id: int) -> dict | None:
+        with self._reading():
+            return self._get(patient_id)
+
+    def _get(self, patient_id: int) -> dict | None:
+        slot = self._index.get(patient_id)
+        return None if slot is None else self._slots[slot]
+
+
+    # filled on first use; an entry only counts for the very record object it
+    # was made from, so a reader racing with an update can never pick up (or
+    # leave behind) bytes of another version of the patient
+    def encoded(self, record: dict) -> bytes:
+        cached = self._encoded.get(record['id'])
+        if cached is not None and cached[0] is record:
+            return cached[1]
+        data = encode_json(record)
+        self._encoded[record['id']] = (record, data)
+        return data
+
+    def encode_records(self, records: list[dict]) -> bytes:
+        return b'[' + b','.join(map(self.encoded, records)) + b']'
+
+
+    # one page of patients in id order, plus the cursor entry to continue
+    # after (None on the last page)
+    def page(self, after: tuple | None = None, limit: int = 100) -> tuple[list[dict], tuple | None]:
+        with self._reading():
+            return self._page(self._by_id.after(after, limit + 1), limit)
+
+    def _page(self, entries: list[tuple], limit: int) -> tuple[list[dict], tuple | None]:
+        more = len(entries) > limit
+        entries = entries[:limit]
+        records = [self._slots[self._index[patient_id]] for _, patient_id in entries]
+        return records, (entries[-1] if more else None)
+
+
+    # one page of the patients matching every given filter (case-insensitive),
+    # in id order; answered from the secondary indexes, whose posting lists
+    # are kept sorted by id, so a page is a bisect to the cursor in each list
+    # and a walk that stops after `limit` matches
+    def query(self, city: str | None = None, gender: str | None = None,
+              diseases: list[str] | None = None,
+              after: tuple | None = None, limit: int = 100) -> tuple[list[dict], tuple | None]:
+        with self._reading():
+            return self._query(city, gender, diseases, after, limit)
+
+    def _query(self, city: str | None, gender: str | None, diseases: list[str] | None,
+               after: tuple | None, limit: int) -> tuple[list[dict], tuple | None]:
+        postings = []
+        if city is not None:
+            postings.append(self._secondary['city'].get(city.casefold()))
+        if gender is not None:
+            postings.append(self._secondary['gender'].get(gender.casefold()))
+        for disease in diseases or []:
+            postings.append(self._secondary['diseases'].get(disease.casefold()))
+        if not postings:
+            return self._page(self._by_id.after(after, limit + 1), limit)
+        if None in postings:
+            return [], None
+
+        # leapfrog: walk the shortest list from the cursor on and let every
+        # other list jump the candidate ahead to its next id
+        postings.sort(key=len)
+        first, rest = postings[0], postings[1:]
+        candidate = next(first.iter_after(None if after is None else after[1]), None)
+        ids = []
+        while candidate is not None and len(ids) <= limit:
+            for posting in rest:
+                found = posting.ceiling(candidate)
+                if found != candidate:
+                    break
+            else:
+                ids.append(candidate)
+                found = candidate + 1
+            candidate = None if found is None else first.ceiling(found)
+        return self._page([((False, patient_id), patient_id) for patient_id in ids], limit)
+
+
+    # index keys of a record for one secondary index, each key once
+    @staticmethod
+    def _keys(record: dict, field: str) -> list[str]:
+        value = record.get(field)
+        if value is None:
+            return []
+        values = value if isinstance(value, list) else [value]
+        return list(dict.fromkeys(str(v).casefold() for v in values))
+
+    # secondary indexes of all the records: posting lists are collected and
+    # sorted once instead of inserting the ids one at a time
+    def _build_secondary(self, records) -> dict[str, defaultdict[str, SortedList]]:
+        ids = {field: defaultdict(list) for field in self.INDEXED_FIELDS}
+        for record in records:
+            for field, index in ids.items():
+                for key in self._keys(record, field):
+                    index[key].append(record['id'])
+        return {field: defaultdict(SortedList, {key: SortedList(posting) for key, posting in index.items()})
+                for field, index in ids.items()}
+
+    # add / remove a record to / from the secondary indexes
+    def _link(self, record: dict):
+        for field, index in self._secondary.items():
+            for key in self._keys(record, field):
+                index[key].add(record['id'])
+
+    def _unlink(self, record: dict):
+        for field, index in self._secondary.items():
+            for key in self._keys(record, field):
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(record['id'])
+                    if not ids:
+                        del index[key]
+
+
+    # changes are applied and committed under the lock (so the log keeps their
+    # order), the wait for the disk happens outside of it
+
+    # returns False if a patient with the same id already exists
+    def add(self, record: dict) -> bool:
+        with self._writing():
+            self._check_writable()
+            if record['id'] in self._index:
+                return False
+            if self._free:
+                slot = self._free.pop()
+                self._slots[slot] = record
+            else:
+                slot = len(self._slots)
+                self._slots.append(record)
+            self._index[record['id']] = slot
+            self._link(record)
+            self._by_id.insert(record)
+            self._notify(None, record)
+            done = self._submit([{'op': 'put', 'patient': record}])
+        self._wait(done)
+        return True
+
+    # add several patients in one commit (one log write for the journal),
+    # or none of them if an id is taken or repeated
+    def add_many(self, records: list[dict]) -> list[int]:
+        with self._writing():
+            self._check_writable()
+            seen = set()
+            duplicates = []
+            for position, record in enumerate(records):
+                if record['id'] in self._index or record['id'] in seen:
+                    duplicates.append(position)
+                seen.add(record['id'])
+            if duplicates or not records:
+                return duplicates
+            for record in records:
+                if self._free:
+                    slot = self._free.pop()
+                    self._slots[slot] = record
+                else:
+                    slot = len(self._slots)
+                    self._slots.append(record)
+                self._index[record['id']] = slot
+                self._link(record)
+            self._by_id.insert_many(records)
+            for record in records:
+                self._notify(None, record)
+            done = self._submit([{'op': 'put', 'patient': record} for record in records])
+        self._wait(done)
+        return []
+
+    # replace the patient with the same id, returns the old record (None if not found)
+    def update(self, record: dict) -> dict | None:
+        with self._writing():
+            self._check_writable()
+            slot = self._index.get(record['id'])
+            if slot is None:
+                return None
+            old_record = self._slots[slot]
+            self._slots[slot] = record
+            self._unlink(old_record)
+            self._link(record)
+            self._encoded.pop(record['id'], None)
+            self._notify(old_record, record)
+            done = self._submit([{'op': 'put', 'patient': record}])
+        self._wait(done)
+        return old_record
+
+    # returns the removed record (None if not found)
+    def delete(self, patient_id: int) -> dict | None:
+        with self._writing():
+            self._check_writable()
+            slot = self._index.pop(patient_id, None)
+            if slot is None:
+                return None
+            record = self._slots[slot]
+            self._slots[slot] = None
+            self._free.append(slot)
+            self._unlink(record)
+            self._by_id.remove(record)
+            self._encoded.pop(patient_id, None)
+            self._notify(record, None)
+            done = self._submit([{'op': 'delete', 'id': patient_id}])
+        self._wait(done)
+        return record
+
+
+    def update_many(self, records: list[dict], atomic: bool = True) -> list[dict | None]:
+        with self._writing():
+            self._check_writable()
+            old_records, done = self._update_many(records, atomic)
+        self._wait(done)
+        return old_records
+
+    # read-modify-write under one hold of the write lock, so no concurrent
+    # change to the same patient can get lost in between
+    def modify_many(self, changes: list[tuple[int, Callable[[dict], dict]]],
+                    atomic: bool = True) -> list[tuple[dict, dict] | None]:
+        with self._writing():
+            self._check_writable()
+            current: dict[int, dict | None] = {}  # a repeated id builds on the earlier change
+            records = []
+            for patient_id, change in changes:
+                existing = current[patient_id] if patient_id in current else self._get(patient_id)
+                current[patient_id] = None if existing is None else change(existing)
+                records.append(current[patient_id])
+            found = [record for record in records if record is not None]
+            if atomic and len(found) < len(records):
+                return [None if record is None else (self._get(record['id']), record) for record in records]
+            old_records, done = self._update_many(found, atomic)
+        self._wait(done)
+        old_records = iter(old_records)
+        return [None if record is None else (next(old_records), record) for record in records]
+
+    # called under the write lock; returns the old records and the commit to wait for
+    def _update_many(self, records: list[dict], atomic: bool) -> tuple[list[dict | None], Future | None]:
+        slots = [self._index.get(record['id']) for record in records]
+        if atomic and None in slots:
+            return [None if slot is None else self._slots[slot] for slot in slots], None
+        old_records = []
+        for record, slot in zip(records, slots):
+            if slot is None:
+                old_records.append(None)
+                continue
+            old_record = self._slots[slot]
+            self._slots[slot] = record
+            self._unlink(old_record)
+            self._link(record)
+            self._encoded.pop(record['id'], None)
+            self._notify(old_record, record)
+            old_records.append(old_record)
+        entries = [{'op': 'put', 'patient': record} for record, slot in zip(records, slots) if slot is not None]
+        return old_records, (self._submit(entries) if entries else None)
+
+    def delete_many(self, patient_ids: list[int], atomic: bool = True) -> list[dict | None]:
+        with self._writing():
+            self._check_writable()
+            # a repeated id only counts as found the first time
+            seen = set()
+            records = []
+            for patient_id in patient_ids:
+                records.append(self._get(patient_id) if patient_id not in seen else None)
+                seen.add(patient_id)
+            if atomic and None in records:
+                return records
+            removed = [record for record in records if record is not None]
+            self._by_id.remove_many(removed)
+            for record in removed:
+                slot = self._index.pop(record['id'])
+                self._slots[slot] = None
+                self._free.append(slot)
+                self._unlink(record)
+                self._encoded.pop(record['id'], None)
+                self._notify(record, None)
+            done = self._submit([{'op': 'delete', 'id': record['id']} for record in removed]) if removed else None
+        self._wait(done)
+        return records
+
+
+
+# The original storage (the "json" backend): every write rewrites the whole
+# JSON file. Kept as a baseline to benchmark the other backends against.
+class JsonFileStore(PatientStore):
+
+    def __init__(self, path: str = 'database.json'):
+        super().__init__(path)
+
+
+    def _commit(self, entries: list[dict]) -> Future:
+        write_snapshot(self.path, self.all())
+        return super()._commit(entries)
+
+    # commits write the file right away, so they go to the I/O executor
+    async def call(self, fn: Callable[..., Any], *args) -> Any:
+        return await PatientRepository.call(self, fn, *args)
+
+
+
+# Patient store with a write-ahead log (the "jsonl" backend).
+# Writes hand one entry for the log (database.jsonl) to the group-commit
+# writer and return once it is durable according to `durability`;
+# snapshot() folds the log back into database.json. Startup loads the last
+# snapshot and replays the log on top of it.
+class JournaledStore(PatientStore):
+
+    def __init__(self, path: str = 'database.json', log_path: str | None = None,
+                 durability: str = 'always', commit_window: float = 0.0, fsync_interval: float = 0.05):
+        super().__init__(path)
+        self.journal = Journal(log_path or os.path.splitext(path)[0] + '.jsonl')
+        self.writer = GroupCommitWriter(self.journal, durability, commit_window, fsync_interval)
+
+
+    def load(self):
+        super().load()
+        self.journal.open()
+        self.writer.start()
+
+
+    def _read(self) -> dict[int, dict]:
+        patients = super()._read()
+        for entry in self.journal.replay():
+            apply_entry(patients, entry)
+        return patients
+
+
+    def _commit(self, entries: list[dict]) -> Future:
+        return self.writer.submit(entries)
+
+
+    # fold the log into database.json and start a new empty log
+    def snapshot(self):
+        with self._reading():
+            if self.journal.entries == 0 or self._failure is not None:
+                return
+            done = self.writer.checkpoint(self.path, self.all())
+        self._wait(done)
+
+
+    # the writer is stopped (flushing what is queued) even if the snapshot fails
+    def close(self):
+        try:
+            self.snapshot()
+        finally:
+            self.writer.stop()
+            self.journal.close()
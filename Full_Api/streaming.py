@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from typing import Callable, Iterable, Iterator, Sequence
+from fastapi.responses import StreamingResponse
+
+
+STREAM_FORMATS = ('json', 'ndjson')
+CHUNK_SIZE = 256  # records per chunk written to the socket
+
+
+# Stream a full listing one chunk at a time instead of building one big dict,
+# so memory stays flat and the first byte goes out right away:
+#   json   -> {"<key>":[{...},{...}]}   (chunked JSON array)
+#   ndjson -> one patient per line      (application/x-ndjson)
+# `encode` turns a record into its JSON bytes (e.g. a repository's encoded(),
+# or serialization.encode_json). It is passed in rather than imported: the
+# lecture apps import this module as Full_Api.streaming, so like the other
+# modules they share it imports no sibling module.
+def stream_records(records: Iterable[dict], fmt: str = 'json', key: str = 'data', *,
+                   encode: Callable[[dict], bytes]) -> StreamingResponse:
+    if fmt == 'ndjson':
+        return StreamingResponse(_ndjson_chunks(records, encode), media_type='application/x-ndjson')
+    return StreamingResponse(_json_array_chunks(records, key, encode), media_type='application/json')
+
+
+def _batches(records: Iterable[dict], encode: Callable[[dict], bytes]) -> Iterator[list[bytes]]:
+    batch = []
+    for record in records:
+        batch.append(encode(record))
+        if len(batch) == CHUNK_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson_chunks(records: Iterable[dict], encode: Callable[[dict], bytes]) -> Iterator[bytes]:
+    for batch in _batches(records, encode):
+        yield b'\n'.join(batch) + b'\n'
+
+
+def _json_array_chunks(records: Iterable[dict], key: str, encode: Callable[[dict], bytes]) -> Iterator[bytes]:
+    yield b'{' + json.dumps(key, ensure_ascii=False).encode('utf-8') + b':['
+    separator = b''
+    for batch in _batches(records, encode):
+        yield separator + b','.join(batch)
+        separator = b','
+    yield b']}'
+
+
+# Stream records as CSV, one column per field; list values (diseases) are
+# joined with ';' and missing values are left empty
+def stream_csv(records: Iterable[dict], fields: Sequence[str], header: bool = True) -> StreamingResponse:
+    return StreamingResponse(_csv_chunks(records, fields, header), media_type='text/csv')
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    return ';'.join(map(str, value)) if isinstance(value, list) else value
+
+
+def _csv_chunks(records: Iterable[dict], fields: Sequence[str], header: bool) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(fields)
+    for count, record in enumerate(records, 1):
+        writer.writerow([_csv_value(record.get(field)) for field in fields])
+        if count % CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
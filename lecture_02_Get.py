@@ -1,25 +1,54 @@
-from fastapi import FastAPI
-import json
+from fastapi import FastAPI, Query
+from typing import Optional, Literal
+from contextlib import asynccontextmanager
+from Full_Api.sorted_index import SortedIndex
+from Full_Api.pagination import encode_cursor, decode_cursor
+from Full_Api.streaming import stream_records
+from Full_Api.serialization import encode_json
+from Full_Api.file_cache import CachedFile
 
 
-app = FastAPI()
+# patients by id and in id order
+def index_patients(data):
+    patient_ids = SortedIndex(lambda patient: patient['id'])
+    patient_ids.build(data)
+    return {patient['id']: patient for patient in data}, patient_ids
 
+# parsed and indexed once, again only when the file changes (see Full_Api/file_cache.py)
+demo_data = CachedFile('lecture_02_demoData.json', index_patients)
 
-def load_data() :
-    with open('lecture_02_demoData.json', 'r') as f:
-        data = json.load(f)
-    return data;
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await load_data()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def load_data() :
+    return await demo_data.get_async()
 
 
 @app.get("/")
-def hello() :  
+async def hello() :  
     return {"message" : "Hello"}
 
 
 @app.get('/view')
-def showInfo():
-    data = load_data()
-    return {'Data' : data}
+async def showInfo(
+        limit: int = Query(100, ge=1, le=1000, description="Maximum number of patients to return"),
+        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        stream: Optional[Literal['json', 'ndjson']] = Query(None, description="Stream every patient as a JSON array or NDJSON instead of one page")
+    ):
+    patients_by_id, patient_ids = await load_data()
+    if stream is not None:
+        return stream_records((patients_by_id[patient_id] for patient_id in patient_ids.ids()), stream, key='Data', encode=encode_json)
+    entries = patient_ids.after(decode_cursor('id', cursor), limit + 1)
+    data = [patients_by_id[patient_id] for _, patient_id in entries[:limit]]
+    last = entries[limit - 1] if len(entries) > limit else None
+    return {'Data' : data, 'next_cursor': encode_cursor('id', last)}
 
 
 
@@ -1,37 +1,116 @@
 from fastapi import FastAPI, Path, HTTPException, Query
-import json
+from fastapi.responses import JSONResponse, Response
+from typing import Optional
+from contextlib import asynccontextmanager
+from Full_Api.sorted_index import SortedIndex
+from Full_Api.pagination import encode_cursor, decode_cursor
+from Full_Api.response_cache import ResponseCache, make_key
+from Full_Api.file_cache import CachedFile
 
 
 
+# computed fields can be sorted on as well
+def bmi(patient):
+    if patient.get('weight') is None or patient.get('height') is None:
+        return None
+    return round(patient['weight'] / (patient['height'] ** 2), 2)
 
-app = FastAPI();
+SORT_FIELDS = {
+    'age': lambda patient: patient.get('age'),
+    'name': lambda patient: patient.get('name'),
+    'bmi': bmi,
+}
 
-def load_data() :
-    with open('lecture_02_demoData.json', 'r') as f:
-        data = json.load(f)
-    return data;
+# type of the sort key of each field, used to check cursors
+SORT_KEY_TYPES = {'age': int, 'name': str, 'bmi': (int, float)}
+
+# the patients plus patients by id and one sorted index per sortable field
+def index_patients(data):
+    sorted_views = {field: SortedIndex(key) for field, key in SORT_FIELDS.items()}
+    for view in sorted_views.values():
+        view.build(data)
+    return data, {patient['id']: patient for patient in data}, sorted_views
+
+# rendered /view and /sort responses (see Full_Api/response_cache.py); the
+# app is read-only, so they only go stale when the file changes
+response_cache = ResponseCache(ttl=300)
+
+# parsed and indexed once, again only when the file changes (see
+# Full_Api/file_cache.py); responses rendered from the old content are dropped
+demo_data = CachedFile('lecture_02_demoData.json', index_patients, on_reload=lambda _: response_cache.clear())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await load_data()
+    yield
+
+
+app = FastAPI(lifespan=lifespan);
+
+async def load_data() :
+    return await demo_data.get_async()
 
 # HTTP GET method to retrieve a list of patients
 @app.get("/view/{patient_id}")
-def view_patient(patient_id: int=Path(..., title="Patient ID", description="The ID of the patient to view", example=1)):
-    data = load_data()
+async def view_patient(patient_id: int=Path(..., title="Patient ID", description="The ID of the patient to view", example=1)):
+    # generation first: a reload racing with this request then keeps its
+    # response out of the cache
+    generation = response_cache.generation
+    data, _, _ = await load_data()
+    key = make_key('view', patient_id=patient_id)
+    body = response_cache.get(key)
+    if body is not None:
+        return Response(body, media_type='application/json')
     if patient_id < 0 or patient_id >= len(data):
         raise HTTPException(status_code=404, detail="Patient not found")
-    return {"patient": data[patient_id]}
+    response = JSONResponse({"patient": data[patient_id]})
+    response_cache.put(key, response.body, generation=generation)
+    return response
+
+# hit / miss counters of the response cache
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
 
 @app.get("/sort")
-def sort_patient(
+async def sort_patient(
         sort_by:str = Query(..., title="Sort By", description="The field to sort patients by", example="age"), 
-        order:str = (Query('asc', title="Order", description="Sort order: asc or desc", example="asc"))
+        order:str = (Query('asc', title="Order", description="Sort order: asc or desc", example="asc")),
+        limit:Optional[int] = Query(None, ge=1, title="Limit", description="Maximum number of patients to return", example=10),
+        offset:int = Query(0, ge=0, title="Offset", description="Number of patients to skip", example=0),
+        cursor:Optional[str] = Query(None, title="Cursor", description="next_cursor of the previous page, used instead of offset")
     ):
-    data = load_data()
-    vield_field = ['age', 'name']
-    if sort_by not in vield_field:
+    if sort_by not in SORT_FIELDS:
         raise HTTPException(status_code=400, detail="Invalid sort field")
     if order not in ['asc', 'desc']:
         raise HTTPException(status_code=400, detail="Invalid sort order")
-    sorted_data = sorted(data, key=lambda x: x[sort_by], reverse=(order == 'desc'))
-    return {"sorted_patients": sorted_data}
+    generation = response_cache.generation
+    _, patients_by_id, sorted_views = await load_data()
+    key = make_key('sort', sort_by=sort_by, order=order, limit=limit, offset=offset, cursor=cursor)
+    body = response_cache.get(key)
+    if body is not None:
+        return Response(body, media_type='application/json')
+
+    view = sorted_views[sort_by]
+    if cursor is None and limit is None:
+        ids = view.ids(order, offset, limit)
+        response = JSONResponse({"sorted_patients": [patients_by_id[patient_id] for patient_id in ids], "next_cursor": None})
+        response_cache.put(key, response.body, generation=generation)
+        return response
+
+    # keyset pagination: the cursor is only valid for the same field and order
+    limit = limit or 100
+    after = decode_cursor(f'{sort_by}:{order}', cursor, SORT_KEY_TYPES[sort_by])
+    if cursor is not None:
+        entries = view.after(after, limit + 1, order)
+    else:
+        entries = view.at(offset, limit + 1, order)
+    sorted_data = [patients_by_id[patient_id] for _, patient_id in entries[:limit]]
+    last = entries[limit - 1] if len(entries) > limit else None
+    response = JSONResponse({"sorted_patients": sorted_data, "next_cursor": encode_cursor(f'{sort_by}:{order}', last)})
+    response_cache.put(key, response.body, generation=generation)
+    return response
     
 
 
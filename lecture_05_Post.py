@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field, EmailStr, AnyUrl, computed_field
 from typing import Annotated, Optional, List, Dict, Any
+from functools import cached_property
 import json
 
 
@@ -34,23 +35,25 @@ class Patient(BaseModel):
     
     
 
+    # cached: computed once per patient instead of on every access / dump
     @computed_field
-    @property
+    @cached_property
     def bmi(self) -> float:
         if self.weight is None or self.height is None:
             return None # type: ignore
         return round(self.weight / (self.height ** 2), 2)
 
     @computed_field
-    @property
+    @cached_property
     def bmi_verdict(self) -> str:
-        if self.bmi is None:
+        bmi = self.bmi
+        if bmi is None:
             return "BMI not available"
-        if self.bmi < 18.5:
+        if bmi < 18.5:
             return "Underweight"
-        elif 18.5 <= self.bmi < 24.9:
+        elif 18.5 <= bmi < 24.9:
             return "Normal weight"
-        elif 25 <= self.bmi < 29.9:
+        elif 25 <= bmi < 29.9:
             return "Overweight"
         else:
             return "Obesity"
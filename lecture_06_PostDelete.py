@@ -2,7 +2,12 @@ from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, EmailStr
 from typing import Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from Full_Api.journal import Journal, apply_entry, write_snapshot
+import asyncio
 import json
+import os
 
 
 # {
@@ -30,34 +35,85 @@ class Update_Patient(BaseModel):
 
 
 
+# changes are appended to patients.jsonl (one line per operation) instead of
+# rewriting the whole list; loading replays them on top of the demo data.
+# A deleted patient stays in the list as a tombstone (None), so the position
+# of every other patient -- which is what the routes use as patient_id -- never shifts.
+# Once the log holds SNAPSHOT_THRESHOLD entries it is folded into
+# patients.snapshot.json ([id, patient or None] pairs, so tombstones keep their
+# place) and started again, so loading never replays more than that.
+# The log stays open while the app runs. All of its I/O (replay, append,
+# snapshot) runs on journal_executor, a single thread: the routes are async
+# and only await it, and every route's load, append and snapshot is one job,
+# so concurrent requests neither lose each other's changes nor write into
+# the log at the same time.
+journal = Journal('patients.jsonl')
+journal_executor = ThreadPoolExecutor(1, thread_name_prefix='patients-journal')
+SNAPSHOT_FILE = 'patients.snapshot.json'
+SNAPSHOT_THRESHOLD = 100
+
+
+def load_patients() :
+    if os.path.exists(SNAPSHOT_FILE):
+        with open(SNAPSHOT_FILE, 'r') as f:
+            patients = dict(json.load(f))
+    else:
+        with open('lecture_02_demoData.json', 'r') as f:
+            patients = {p['id']: p for p in json.load(f)}
+    for entry in journal.replay():
+        if entry['op'] == 'delete' and entry['id'] in patients:
+            patients[entry['id']] = None
+        else:
+            apply_entry(patients, entry)
+    return patients
+
 def load_data() :
-    with open('lecture_02_demoData.json', 'r') as f:
-        data = json.load(f)
-    return data
+    return list(load_patients().values())
 
-def save_data(data):
-    with open('patients.json', 'w') as f:
-        json.dump(data, f)
+# await fn(*args) on the journal thread
+async def run_in_journal(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(journal_executor, fn, *args)
 
+def save_data(entry):
+    journal.append(entry)
+    if journal.entries >= SNAPSHOT_THRESHOLD:
+        # the snapshot is written (atomically) before the log is emptied;
+        # a crash in between only replays entries the snapshot already has
+        write_snapshot(SNAPSHOT_FILE, list(load_patients().items()))
+        journal.reset()
 
 
+def open_journal():
+    load_patients()  # cuts off a torn last entry before anything is appended
+    journal.open()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_journal(open_journal)
+    yield
+    await run_in_journal(journal.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
-@app.put("/update/{patient_id}")
-def update_patient(patient_id: int, patient: Update_Patient):
 
+def apply_update(patient_id: int, update_data: dict) -> dict:
     data = load_data()
-    if patient_id < 0 or patient_id >= len(data):
+    if patient_id < 0 or patient_id >= len(data) or data[patient_id] is None:
         raise HTTPException(status_code=404, detail="Patient not found")
     patient_data = data[patient_id]
-    update_data = patient.dict(exclude_unset=True)
     for key, value in update_data.items():
         if value is not None:
             patient_data[key] = value
 
-    patient_data['id'] = patient_id
     data[patient_id] = patient_data
-    save_data(data)
+    save_data({'op': 'put', 'patient': patient_data})
+    return patient_data
+
+@app.put("/update/{patient_id}")
+async def update_patient(patient_id: int, patient: Update_Patient):
+    patient_data = await run_in_journal(apply_update, patient_id, patient.dict(exclude_unset=True))
     return {"message": "Patient updated successfully", "updated_patient": patient_data}
 
 
@@ -65,15 +121,16 @@ def update_patient(patient_id: int, patient: Update_Patient):
 
 
 
-@app.delete("/delete/{patient_id}")
-def delete_patient(patient_id: int):
+def apply_delete(patient_id: int):
     data = load_data()
-    if patient_id < 0 or patient_id >= len(data):
+    if patient_id < 0 or patient_id >= len(data) or data[patient_id] is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    
-    del data[patient_id]
 
-    save_data(data)
+    save_data({'op': 'delete', 'id': data[patient_id]['id']})
+
+@app.delete("/delete/{patient_id}")
+async def delete_patient(patient_id: int):
+    await run_in_journal(apply_delete, patient_id)
 
     return JSONResponse(status_code=200, content={'message':'patient deleted'})
 